@@ -1,4 +1,5 @@
-from flask_restx import reqparse, fields
+from flask_restx import reqparse, fields, inputs
+from werkzeug.datastructures import FileStorage
 
 parserWandb = reqparse.RequestParser(bundle_errors=True)
 parserWandb.add_argument("key",
@@ -98,6 +99,77 @@ parserTrain.add_argument("freeze_backbone",
                          help="Freeze backbone",
                          location="args")
 
+parserTrain.add_argument("share_backbone",
+                         type=inputs.boolean,
+                         required=False,
+                         default=False,
+                         help="With a frozen backbone, reuse one backbone instance across models and store only the head",
+                         location="args")
+
+parserTrain.add_argument("use_cache",
+                         type=inputs.boolean,
+                         required=False,
+                         default=False,
+                         help="Keep decoded and resized images in the on-disk tensor cache",
+                         location="args")
+
+parserTrain.add_argument("precompute_embeddings",
+                         type=inputs.boolean,
+                         required=False,
+                         default=False,
+                         help="With a frozen backbone, compute features once and train only the head on them",
+                         location="args")
+
+parserTrain.add_argument("patience",
+                         type=int,
+                         required=False,
+                         default=None,
+                         help="Stop after this many epochs without validation improvement; never stops early if empty",
+                         location="args")
+
+parserTrain.add_argument("min_delta",
+                         type=float,
+                         required=False,
+                         default=0.,
+                         help="Minimum increase of validation accuracy that counts as an improvement",
+                         location="args")
+
+parserTrain.add_argument("restore_best",
+                         type=inputs.boolean,
+                         required=False,
+                         default=True,
+                         help="Restore the weights of the best validation epoch after training",
+                         location="args")
+
+parserTrain.add_argument("precision",
+                         type=str,
+                         required=False,
+                         default='fp32',
+                         choices=('fp32', 'bf16'),
+                         help="fp32/bf16; bf16 runs forward passes under autocast",
+                         location="args")
+
+parserTrain.add_argument("channels_last",
+                         type=inputs.boolean,
+                         required=False,
+                         default=False,
+                         help="Use channels_last memory format for the model and inputs",
+                         location="args")
+
+parserTrain.add_argument("num_processes",
+                         type=int,
+                         required=False,
+                         default=1,
+                         help="Number of data-parallel training processes (DistributedDataParallel over gloo, cpu only)",
+                         location="args")
+
+parserTrain.add_argument("threads_per_process",
+                         type=int,
+                         required=False,
+                         default=None,
+                         help="Intra-op threads of every training process; cpu count / num_processes if empty",
+                         location="args")
+
 parserTest = reqparse.RequestParser(bundle_errors=True)
 parserTest.add_argument("name",
                         type=str,
@@ -111,6 +183,27 @@ parserTest.add_argument("dataset_path",
                         help="Path to dataset",
                         location="args")
 
+parserTest.add_argument("batch_size",
+                        type=int,
+                        required=False,
+                        default=32,
+                        help="Batch size",
+                        location="args")
+
+parserTest.add_argument("top_k",
+                        type=str,
+                        required=False,
+                        default='1,5',
+                        help="Comma-separated k values of the reported top-k accuracies",
+                        location="args")
+
+parserTest.add_argument("variant",
+                        type=str,
+                        required=False,
+                        default=None,
+                        help="Inference variant of the model, e.g. int8; the default one if empty",
+                        location="args")
+
 
 parserPredict = reqparse.RequestParser(bundle_errors=True)
 parserPredict.add_argument("name",
@@ -121,7 +214,169 @@ parserPredict.add_argument("name",
                         location="args")
 
 parserPredict.add_argument("dataset_path",
+                        type=str,
+                        required=False,
+                        help="Path to data (directory with images); not needed when images or an array are uploaded",
+                        location="args")
+
+parserPredict.add_argument("images",
+                        type=FileStorage,
+                        required=False,
+                        action="append",
+                        help="Images uploaded as multipart/form-data; predictions are returned in upload order",
+                        location="files")
+
+parserPredict.add_argument("shape",
+                        type=str,
+                        required=False,
+                        help="Shape of a raw application/octet-stream body, e.g. 8,3,224,224",
+                        location="args")
+
+parserPredict.add_argument("dtype",
+                        type=str,
+                        required=False,
+                        default='uint8',
+                        choices=('uint8', 'float32'),
+                        help="Element type of a raw application/octet-stream body",
+                        location="args")
+
+parserPredict.add_argument("top_k",
+                        type=int,
+                        required=False,
+                        default=None,
+                        help="For uploads: return the k most probable labels with their probabilities instead of a single label",
+                        location="args")
+
+parserPredict.add_argument("variant",
+                        type=str,
+                        required=False,
+                        default=None,
+                        help="Inference variant of the model, e.g. int8; the fp32 model if empty",
+                        location="args")
+
+parserPredict.add_argument("stream",
+                        type=inputs.boolean,
+                        required=False,
+                        default=False,
+                        help="Stream predictions back as NDJSON while the directory is processed",
+                        location="args")
+
+parserPredictMulti = reqparse.RequestParser(bundle_errors=True)
+parserPredictMulti.add_argument("names",
+                        type=str,
+                        required=True,
+                        help="Comma-separated names of the models to predict with",
+                        location="args")
+
+parserPredictMulti.add_argument("dataset_path",
                         type=str,
                         required=True,
                         help="Path to data (directory with images)",
                         location="args")
+
+parserQuantize = reqparse.RequestParser(bundle_errors=True)
+parserQuantize.add_argument("name",
+                            type=str,
+                            required=True,
+                            help="Name of a trained model you want to quantize",
+                            location="args")
+
+parserQuantize.add_argument("dataset_path",
+                            type=str,
+                            required=True,
+                            help="Path to the training dataset; its validation part is used for calibration",
+                            location="args")
+
+parserQuantize.add_argument("valid_part",
+                            type=float,
+                            required=False,
+                            default=0.1,
+                            help="What fraction of data goes to validation part",
+                            location="args")
+
+parserQuantize.add_argument("batch_size",
+                            type=int,
+                            required=False,
+                            default=32,
+                            help="Batch size",
+                            location="args")
+
+parserQuantize.add_argument("backend",
+                            type=str,
+                            required=False,
+                            default='x86',
+                            choices=('fbgemm', 'x86'),
+                            help="fbgemm/x86",
+                            location="args")
+
+parserQuantize.add_argument("calibration_batches",
+                            type=int,
+                            required=False,
+                            default=10,
+                            help="Number of validation batches used for calibration",
+                            location="args")
+
+parserCompile = reqparse.RequestParser(bundle_errors=True)
+parserCompile.add_argument("name",
+                           type=str,
+                           required=True,
+                           help="Name of a trained model you want to compile",
+                           location="args")
+
+parserCompile.add_argument("method",
+                           type=str,
+                           required=False,
+                           default='torchscript',
+                           choices=('torchscript', 'compile'),
+                           help="torchscript (trace + torch.jit.freeze)/compile (torch.compile)",
+                           location="args")
+
+parserProfile = reqparse.RequestParser(bundle_errors=True)
+parserProfile.add_argument("name",
+                           type=str,
+                           required=True,
+                           help="Name of a model you want to profile",
+                           location="args")
+
+parserProfile.add_argument("target",
+                           type=str,
+                           required=False,
+                           default='predict',
+                           choices=('train', 'predict'),
+                           help="train (next training steps)/predict (next predict batches)",
+                           location="args")
+
+parserProfile.add_argument("steps",
+                           type=int,
+                           required=False,
+                           default=10,
+                           help="Number of steps to profile",
+                           location="args")
+
+parserRuns = reqparse.RequestParser(bundle_errors=True)
+parserRuns.add_argument("model_name",
+                        type=str,
+                        required=False,
+                        default=None,
+                        help="Only list runs of this model",
+                        location="args")
+
+parserRuns.add_argument("limit",
+                        type=int,
+                        required=False,
+                        default=100,
+                        help="Maximum number of runs, most recent first",
+                        location="args")
+
+parserRollback = reqparse.RequestParser(bundle_errors=True)
+parserRollback.add_argument("name",
+                        type=str,
+                        required=True,
+                        help="Name of a model",
+                        location="args")
+
+parserRollback.add_argument("version",
+                        type=int,
+                        required=True,
+                        help="Published version to make current again, see versions in /models/list",
+                        location="args")
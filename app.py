@@ -1,23 +1,89 @@
+import io
+import json
+import multiprocessing
 import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 
-import wandb
-from flask import Flask
+from flask import Flask, Response, g, request, send_file, stream_with_context
 from flask_restx import Resource, Api
 
 from api_parsers import *
 from model_wrapper import ModelWrapper
-from trainer import Trainer
-from dataloader import build_train_dataloader, build_predict_dataloader, build_cifar_dataloader
+from trainer import Trainer, TrainingCancelled
+from dataloader import build_train_dataloader, build_predict_dataloader, build_cifar_dataloader, list_images, \
+    build_test_dataloader, load_image, tensor_from_buffer, tensor_from_npy
+from jobs import JobScheduler
+from batching import BatchingEngine
+from tensor_cache import TensorCache
+from registry import ModelRegistry
+from distributed import DistributedProgress, train_distributed
+from quantization import quantize_static
+from compiled import available_methods, compile_model
+from prediction_cache import PredictionCache, prediction_key
+from profiling import PROFILER
+from backbones import SHARED_BACKBONES, predict_shared
+from evaluation import class_index_map, evaluate
+from tracking import Tracker
+import config
+import telemetry
 
-MAX_MODEL_NUM = 10
-MODELS_DICT = {}
+MODELS_DICT = ModelRegistry(config.MODEL_STORE_DIR, config.MODEL_MEMORY_BUDGET_BYTES)
 CONFIG = {'wandb_enabled': False}
+JOBS = JobScheduler(config.TRAIN_WORKERS, config.MAX_QUEUED_JOBS, config.MAX_FINISHED_JOBS,
+                   config.FINISHED_JOB_TTL_SECONDS)
+BATCHERS = {}
+TENSOR_CACHE = TensorCache(config.TENSOR_CACHE_DIR, config.TENSOR_CACHE_BUDGET_BYTES)
+BATCHERS_LOCK = threading.Lock()
+COMPILER = ThreadPoolExecutor(max_workers=1, thread_name_prefix='compiler')
+CONSTRUCTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix='model-constructor')
+PENDING_MODELS = {}
+STARTUP = {'preloaded': not config.PRELOAD_MODELS}
+COMPILE_STATUS = {}
+PREDICTION_CACHE = PredictionCache(config.PREDICTION_CACHE_MAX_ENTRIES, config.PREDICTION_CACHE_MAX_BYTES)
+TRACKER = Tracker(config.TRACKING_DB, config.TRACKING_FLUSH_INTERVAL_SECONDS)
 
 app = Flask(__name__)
 app.config["BUNDLE_ERRORS"] = True
 api = Api(app)
 
 
+def _endpoint_label():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    telemetry.REQUESTS_IN_FLIGHT.inc(endpoint=_endpoint_label())
+
+
+@app.after_request
+def record_request_latency(response):
+    if 'request_start' in g:
+        telemetry.REQUEST_LATENCY.observe(time.perf_counter() - g.request_start, endpoint=_endpoint_label(),
+                                          method=request.method, status=response.status_code)
+    return response
+
+
+@app.teardown_request
+def finish_request(exc):
+    if 'request_start' in g:
+        telemetry.REQUESTS_IN_FLIGHT.dec(endpoint=_endpoint_label())
+
+
+@app.route("/metrics")
+def metrics():
+    telemetry.MODEL_MEMORY_BYTES.clear()
+    for name, memory_bytes in MODELS_DICT.resident_memory().items():
+        telemetry.MODEL_MEMORY_BYTES.set(memory_bytes, model=name)
+    rss = telemetry.process_rss()
+    if rss is not None:
+        telemetry.PROCESS_MEMORY_BYTES.set(rss)
+    return Response(telemetry.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
 @api.route("/wandb/auth", methods=['POST'])
 class WandAuth(Resource):
     @api.expect(parserWandb)
@@ -26,9 +92,12 @@ class WandAuth(Resource):
         404: "Login failed"
     })
     def post(self):
+        import wandb  # only imported once W&B is actually used
         success = wandb.login(key=parserWandb.parse_args()['key'])
         if success:
             CONFIG['wandb_enabled'] = True
+            # runs finished while W&B was not available are uploaded now
+            TRACKER.sync_pending()
             return {"status": "login succesful"}, 201
         else:
             return {"status": "login failed"}, 404
@@ -42,45 +111,54 @@ class ModelList(Resource):
                    "models": {
                        i: {
                            "name": i,
-                           "info":
-                               MODELS_DICT[i].get_info(),
+                           **MODELS_DICT.get_info(i),
+                           "compile_status": compile_status(i),
                        }
                        for i in MODELS_DICT.keys()
-                   }
+                   },
+                   "pending": dict(PENDING_MODELS),
+                   "memory": MODELS_DICT.get_stats(),
+                   "shared_backbones": SHARED_BACKBONES.get_info()
                }, 201
 
 
+def construct_model(name, backbone_type, device):
+    try:
+        MODELS_DICT[name] = ModelWrapper(backbone_type, device)
+        PENDING_MODELS.pop(name, None)
+    except Exception as e:
+        PENDING_MODELS[name] = {"status": "failed", "message": getattr(e, "message", repr(e))}
+
+
+def preload_models():
+    try:
+        for name in MODELS_DICT.keys():
+            stats = MODELS_DICT.get_stats()
+            if stats["resident_bytes"] >= stats["budget_bytes"]:
+                break
+            MODELS_DICT[name]  # loads the model from disk
+    finally:
+        STARTUP['preloaded'] = True
+
+
 @api.route("/models/add")
 class ModelAdd(Resource):
     @api.expect(parserAdd)
     @api.doc(
         responses={
-            201: "Success",
+            202: "Model construction started",
             401: "'params' error; Params must be a valid json or dict",
-            402: "Error while initializing model; See description for more info",
-            403: "Model with a given name already exists",
-            408: "The max number of models has been reached"
+            403: "Model with a given name already exists"
         })
     def post(self):
         args = parserAdd.parse_args()
 
-        if len(MODELS_DICT) >= MAX_MODEL_NUM:
-            return {
-                       "status":
-                           "Failed",
-                       "message":
-                           "The max number of models has been reached; You must delete one before creating another"
-                   }, 408
-
-        if args["name"] not in MODELS_DICT.keys():
-            try:
-                MODELS_DICT[args["name"]] = ModelWrapper(args["backbone_type"], args["device"])
-                return {"status": "OK", "message": f"Model {args['name']} created on {args['device']}!"}, 201
-            except Exception as e:
-                return {
-                           "status": "Failed",
-                           "message": getattr(e, "message", repr(e))
-                       }, 402
+        pending = PENDING_MODELS.get(args["name"])
+        if args["name"] not in MODELS_DICT.keys() and (pending is None or pending["status"] == "failed"):
+            # building the torchvision model is slow, so it happens off the request thread
+            PENDING_MODELS[args["name"]] = {"status": "initializing", "message": None}
+            CONSTRUCTOR.submit(construct_model, args["name"], args["backbone_type"], args["device"])
+            return {"status": "OK", "message": f"Model {args['name']} is being created on {args['device']}"}, 202
         else:
             return {
                        "status": "Failed",
@@ -88,14 +166,242 @@ class ModelAdd(Resource):
                    }, 403
 
 
+@api.route("/ready")
+class Ready(Resource):
+    @api.doc(responses={
+        200: "Ready to serve",
+        503: "Models are still being loaded or created"
+    })
+    def get(self):
+        initializing = [name for name, pending in list(PENDING_MODELS.items()) if pending["status"] == "initializing"]
+        ready = STARTUP['preloaded'] and not initializing
+        return {"ready": ready,
+                "preloaded": STARTUP['preloaded'],
+                "initializing": initializing}, 200 if ready else 503
+
+
+def get_batcher(name, variant=None):
+    with BATCHERS_LOCK:
+        if (name, variant) not in BATCHERS:
+            BATCHERS[(name, variant)] = BatchingEngine(lambda: MODELS_DICT[name], config.BATCH_MAX_SIZE,
+                                                       config.BATCH_MAX_WAIT_MS, variant, name)
+        return BATCHERS[(name, variant)]
+
+
+def predict_directory(name, variant, path):
+    """Yields (file, label) in file order; only images missing from the prediction cache are decoded and predicted.
+
+    One DataLoader reads all cache misses, and results are yielded after every submitted batch as far as they
+    are ready, so streamed responses start after the first batch.
+    """
+    files = list_images(path)
+    # resolved once, so the whole request is answered and cached by the same version even if a new one is published
+    model_wrapper = MODELS_DICT[name]
+    version = model_wrapper.version
+    keys, labels, misses = [], [], []
+    for file in files:
+        with open(os.path.join(path, file), 'rb') as f:
+            key = prediction_key(name, version, variant, f.read())
+        keys.append(key)
+        labels.append(PREDICTION_CACHE.get(key))
+        if labels[-1] is None:
+            misses.append(len(labels) - 1)
+
+    position = 0
+
+    def ready(wait=False):
+        nonlocal position
+        while position < len(files):
+            label = labels[position]
+            if label is None:  # a cache miss that is not submitted yet
+                return
+            if isinstance(label, Future):
+                if not wait and not label.done():
+                    return
+                label = label.result()
+                PREDICTION_CACHE.put(keys[position], label)
+            yield files[position], label
+            position += 1
+
+    if misses:
+        batcher = get_batcher(name, variant)
+        dataloader = build_predict_dataloader(path,
+                                              config.PREDICT_BATCH_SIZE,
+                                              config.PREDICT_NUM_WORKERS,
+                                              config.PREDICT_PREFETCH_FACTOR,
+                                              files=[files[i] for i in misses])
+        submitted = 0
+        for x in dataloader:
+            for i, future in zip(misses[submitted:], batcher.submit_many(x, model_wrapper=model_wrapper)):
+                labels[i] = future
+            submitted += len(x)
+            yield from ready()
+    yield from ready(wait=True)
+
+
+def predict_images(name, variant, images, top_k=None):
+    """Predictions for uploaded image files in upload order; labels are looked up in the prediction cache first."""
+    model_wrapper = MODELS_DICT[name]
+    version = model_wrapper.version
+    batcher = get_batcher(name, variant)
+    keys, results = [], []
+    for image in images:
+        data = image.read()
+        key = prediction_key(name, version, variant, data)
+        label = PREDICTION_CACHE.get(key) if top_k is None else None
+        keys.append(key)
+        if label is None:
+            label = batcher.submit(load_image(io.BytesIO(data)), top_k, model_wrapper)
+        results.append(label)
+    results = [result.result() if isinstance(result, Future) else result for result in results]
+    if top_k is None:
+        for key, label in zip(keys, results):
+            PREDICTION_CACHE.put(key, label)
+    return results
+
+
+def predict_array(name, variant, body, mimetype, shape=None, dtype='uint8', top_k=None):
+    """Predictions for a batched array sent as the request body, in batch order."""
+    if mimetype == 'application/x-npy':
+        x = tensor_from_npy(body)
+    else:
+        if shape is None:
+            raise ValueError("shape is required for application/octet-stream bodies")
+        x = tensor_from_buffer(body, [int(dim) for dim in shape.split(',')], dtype)
+    return get_batcher(name, variant).predict(x, top_k, MODELS_DICT[name])
+
+
+def stream_predictions(name, variant, path):
+    try:
+        for file, label in predict_directory(name, variant, path):
+            yield json.dumps({"file": file, "label": label}) + "\n"
+    except Exception as e:
+        yield json.dumps({"status": "Failed", "message": getattr(e, "message", repr(e))}) + "\n"
+
+
+def build_compiled(name, model_wrapper, method):
+    variants = model_wrapper.variants
+    try:
+        module, info = compile_model(model_wrapper, method, config.COMPILE_BATCH_SIZES)
+        # the model was re-initialized meanwhile, which resets the variants; the module would serve stale weights
+        # stored with the model's version, so it is loaded again with it instead of being rebuilt
+        if model_wrapper.variants is variants and MODELS_DICT.add_variant(name, model_wrapper, 'compiled', module,
+                                                                          info, default=True):
+            COMPILE_STATUS[name] = 'ready'
+        else:
+            COMPILE_STATUS[name] = 'outdated'
+    except Exception as e:
+        COMPILE_STATUS[name] = f"failed: {getattr(e, 'message', repr(e))}"
+
+
+def schedule_compile(name, model_wrapper, method=config.COMPILE_METHOD):
+    if model_wrapper.shared_backbone:
+        # a compiled module holds its own copy of the backbone, which would undo the sharing
+        COMPILE_STATUS[name] = 'skipped: shared backbone'
+        return
+    COMPILE_STATUS[name] = 'pending'
+    COMPILER.submit(build_compiled, name, model_wrapper, method)
+
+
+def compile_status(name):
+    status = COMPILE_STATUS.get(name)
+    if status is None or status == 'ready':
+        # the model may have been replaced, or evicted and loaded again since; only report what is served
+        info = MODELS_DICT.get_info(name)
+        compiled = info["info"].get("variants", {}).get('compiled')
+        if compiled is None or not (compiled.get("persisted") or info["resident"]):
+            return None
+        return 'ready'
+    return status
+
+
+def run_training(job):
+    args = job.params
+    train_config = {'model_name': args['model_name'],
+                    'optimizer_name': args["optimizer_name"],
+                    "lr": args["learning_rate"],
+                    'freeze_backbone': args["freeze_backbone"],
+                    'share_backbone': args["share_backbone"],
+                    'precompute_embeddings': args["precompute_embeddings"],
+                    'embedding_cache_dir': config.EMBEDDING_CACHE_DIR,
+                    'dataset_path': args["dataset_path"],
+                    'patience': args["patience"],
+                    'min_delta': args["min_delta"],
+                    'restore_best': args["restore_best"],
+                    'precision': args["precision"],
+                    'channels_last': args["channels_last"]
+                    }
+    # training runs on a private copy; predictions keep using the current version until the new one is published
+    model_wrapper = MODELS_DICT[args['model_name']].copy()
+    run = TRACKER.start_run(job.id, args['model_name'], args["project_name"], args["experiment_name"],
+                            dict(train_config,
+                                 backbone_name=model_wrapper.backbone_name,
+                                 batch_size=args["batch_size"],
+                                 valid_part=args["valid_part"],
+                                 epochs_numb=args["epochs_numb"],
+                                 num_processes=args["num_processes"]),
+                            sync_wandb=CONFIG['wandb_enabled'])
+    model_wrapper.wandb = {"project": args["project_name"],
+                           "name": args["experiment_name"],
+                           "run_id": job.id}
+
+    try:
+        if args["num_processes"] > 1:
+            job.trainer = DistributedProgress()
+            data_args = {"dataset_path": args["dataset_path"],
+                         "batch_size": args["batch_size"],
+                         "valid_part": args["valid_part"],
+                         "cache_dir": config.TENSOR_CACHE_DIR if args["use_cache"] else None,
+                         "cache_budget_bytes": config.TENSOR_CACHE_BUDGET_BYTES}
+            trainer = train_distributed(model_wrapper, train_config, data_args, args['epochs_numb'],
+                                        args["num_processes"], args["threads_per_process"],
+                                        stop_event=job.stop_event, progress=job.trainer)
+            # the workers do not log; their per-epoch metrics are recorded once they are done
+            for phase, phase_metrics in trainer.metrics.items():
+                for epoch in range(len(phase_metrics['loss'])):
+                    run.log(epoch, {f"{name}_{phase}": values[epoch] for name, values in phase_metrics.items()})
+        else:
+            id2label, dataloaders = build_train_dataloader(args["dataset_path"],
+                                                           args["batch_size"],
+                                                           args["valid_part"],
+                                                           cache=TENSOR_CACHE if args["use_cache"] else None)
+            trainer = Trainer(train_config, model_wrapper, dataloaders, id2label,
+                              run=run, stop_event=job.stop_event)
+            job.trainer = trainer
+            trainer.train(args['epochs_numb'])
+        model_wrapper.eval()
+        version = MODELS_DICT.publish(args['model_name'], model_wrapper)
+    except TrainingCancelled:
+        run.finish('cancelled')
+        raise
+    except Exception as e:
+        run.finish('failed', {"message": getattr(e, "message", repr(e))})
+        raise
+
+    run.finish('completed', {"best_score": float(trainer.last_record),
+                             "best_epoch": trainer.best_epoch,
+                             "stopped_epoch": trainer.stopped_epoch,
+                             "version": version,
+                             "learnable_params": model_wrapper.count_parameters(),
+                             "stage_seconds": getattr(trainer, 'stage_seconds', None)})
+    PREDICTION_CACHE.invalidate(args['model_name'])
+    if config.COMPILE_AFTER_TRAIN:
+        schedule_compile(args['model_name'], model_wrapper)
+    return {"best_score": float(trainer.last_record),
+            "best_epoch": trainer.best_epoch,
+            "stopped_epoch": trainer.stopped_epoch,
+            "version": version}
+
+
 @api.route("/models/train", methods=['POST'])
 class ModelTrain(Resource):
     @api.expect(parserTrain)
     @api.doc(
         responses={
-            201: "Success",
+            202: "Training job enqueued",
             404: "Model with a given name does not exist",
-            406: "Error while training model; See description for more info"
+            408: "The max number of queued training jobs has been reached",
+            409: "Model with a given name is already being trained"
         })
     def post(self):
         args = parserTrain.parse_args()
@@ -104,43 +410,186 @@ class ModelTrain(Resource):
                        "status": "Failed",
                        "message": "Model with a given name does not exist!"
                    }, 404
-        else:
-            try:
-                id2label, dataloaders = build_train_dataloader(args["dataset_path"],
-                                                               args["batch_size"],
-                                                               args["valid_part"])
-
-                config = {'optimizer_name': args["optimizer_name"],
-                          "lr": args["learning_rate"],
-                          'freeze_backbone': args["freeze_backbone"]
-                          }
-                trainer = Trainer(config, MODELS_DICT[args['model_name']], dataloaders, id2label)
-                if CONFIG['wandb_enabled']:
-                    wandb.init(
-                        project=args["project_name"],
-                        name=args["experiment_name"],
-                        config={
-                            "dataset": args["dataset_path"],
-                            "optimizer": args["optimizer_name"],
-                            "freeze_backbone": args["freeze_backbone"],
-                            "backbone_name": MODELS_DICT[args['model_name']].backbone_name,
-                            "learnable_params": MODELS_DICT[args['model_name']].learnable_parameters,
-                        })
-                    wandb_url = wandb.run.get_url()
-                else:
-                    wandb_url = None
-
-                trainer.wandb_params = trainer
-                MODELS_DICT[args['model_name']].wandb = {"project": args["project_name"],
-                                                         "name": args["experiment_name"],
-                                                         "url": wandb_url}
-                trainer.train(args['epochs_numb'])
-                return {"status": "OK", "message": f"Best train score {trainer.last_record}"}, 201
-            except Exception as e:
-                return {
-                           "status": "Failed",
-                           "message": getattr(e, "message", repr(e))
-                       }, 406
+
+        active_job = JOBS.active_job(args['model_name'])
+        if active_job is not None:
+            return {
+                       "status": "Failed",
+                       "message": f"Model is already being trained by job {active_job.id}"
+                   }, 409
+
+        job = JOBS.submit(args['model_name'], dict(args), run_training)
+        if job is None:
+            return {
+                       "status": "Failed",
+                       "message": "The max number of queued training jobs has been reached"
+                   }, 408
+        return {"status": "OK", "job_id": job.id, "message": f"Training job {job.id} enqueued"}, 202
+
+
+@api.route("/jobs/list")
+class JobList(Resource):
+    @api.doc(responses={201: "Success"})
+    def get(self):
+        return {"jobs": {job_id: job.get_info() for job_id, job in list(JOBS.jobs.items())}}, 201
+
+
+@api.route("/runs/list")
+class RunList(Resource):
+    @api.expect(parserRuns)
+    @api.doc(responses={201: "Success"})
+    def get(self):
+        args = parserRuns.parse_args()
+        return {"runs": TRACKER.list_runs(args['model_name'], args['limit']),
+                "tracking": TRACKER.get_stats()}, 201
+
+
+@api.route("/runs/<string:run_id>")
+class RunStatus(Resource):
+    @api.doc(
+        responses={
+            201: "Success",
+            404: "Run with a given id does not exist"
+        })
+    def get(self, run_id):
+        run = TRACKER.get_run(run_id)
+        if run is None:
+            return {
+                       "status": "Failed",
+                       "message": "Run with a given id does not exist"
+                   }, 404
+        return run, 201
+
+
+@api.route("/jobs/<string:job_id>")
+class JobStatus(Resource):
+    @api.doc(
+        responses={
+            201: "Success",
+            404: "Job with a given id does not exist"
+        })
+    def get(self, job_id):
+        job = JOBS.get(job_id)
+        if job is None:
+            return {
+                       "status": "Failed",
+                       "message": "Job with a given id does not exist"
+                   }, 404
+        return job.get_info(), 201
+
+
+@api.route("/jobs/<string:job_id>/cancel", methods=['POST'])
+class JobCancel(Resource):
+    @api.doc(
+        responses={
+            201: "Cancellation requested",
+            404: "Job with a given id does not exist"
+        })
+    def post(self, job_id):
+        job = JOBS.cancel(job_id)
+        if job is None:
+            return {
+                       "status": "Failed",
+                       "message": "Job with a given id does not exist"
+                   }, 404
+        return {"status": "OK", "message": f"Cancellation of job {job_id} requested", "job": job.get_info()}, 201
+
+
+def run_quantization(job):
+    args = job.params
+    model_wrapper = MODELS_DICT[args['name']]
+    id2label, dataloaders = build_train_dataloader(args["dataset_path"],
+                                                   args["batch_size"],
+                                                   args["valid_part"])
+    if list(id2label) != list(model_wrapper.id2label):
+        raise ValueError("Dataset classes do not match the classes of the model")
+    int8_model, info = quantize_static(model_wrapper, dataloaders['valid'], args['backend'],
+                                       args['calibration_batches'])
+    # stored with the model's version, so it survives eviction, restarts and rollbacks to that version
+    current = MODELS_DICT.add_variant(args['name'], model_wrapper, 'int8', int8_model, info)
+    PREDICTION_CACHE.invalidate(args['name'])
+    if not current:
+        raise ValueError(f"Version {model_wrapper.version} was replaced while quantizing; "
+                         f"its int8 variant is stored with it but not served")
+    return info
+
+
+@api.route("/models/quantize", methods=['POST'])
+class ModelQuantize(Resource):
+    @api.expect(parserQuantize)
+    @api.doc(
+        responses={
+            202: "Quantization job enqueued",
+            404: "Model with a given name does not exist",
+            405: "Model is not trained",
+            408: "The max number of queued jobs has been reached",
+            409: "Model with a given name is already being trained"
+        })
+    def post(self):
+        args = parserQuantize.parse_args()
+        if args['name'] not in MODELS_DICT.keys():
+            return {
+                       "status": "Failed",
+                       "message": "Model with a given name does not exist!"
+                   }, 404
+        if not MODELS_DICT[args['name']].trained:
+            return {
+                       "status": "Failed",
+                       "message": "Model must be trained before it can be quantized"
+                   }, 405
+
+        active_job = JOBS.active_job(args['name'])
+        if active_job is not None:
+            return {
+                       "status": "Failed",
+                       "message": f"Model is already being trained by job {active_job.id}"
+                   }, 409
+
+        job = JOBS.submit(args['name'], dict(args), run_quantization)
+        if job is None:
+            return {
+                       "status": "Failed",
+                       "message": "The max number of queued jobs has been reached"
+                   }, 408
+        return {"status": "OK", "job_id": job.id, "message": f"Quantization job {job.id} enqueued"}, 202
+
+
+@api.route("/models/compile", methods=['POST'])
+class ModelCompile(Resource):
+    @api.expect(parserCompile)
+    @api.doc(
+        responses={
+            202: "Compilation scheduled",
+            400: "Compile method is not supported by the installed torch",
+            404: "Model with a given name does not exist",
+            405: "Model is not trained or shares its backbone"
+        })
+    def post(self):
+        args = parserCompile.parse_args()
+        if args['name'] not in MODELS_DICT.keys():
+            return {
+                       "status": "Failed",
+                       "message": "Model with a given name does not exist!"
+                   }, 404
+        model_wrapper = MODELS_DICT[args['name']]
+        if not model_wrapper.trained:
+            return {
+                       "status": "Failed",
+                       "message": "Model must be trained before it can be compiled"
+                   }, 405
+        if model_wrapper.shared_backbone:
+            return {
+                       "status": "Failed",
+                       "message": "Models with a shared backbone are not compiled; it would copy the backbone"
+                   }, 405
+        if args['method'] not in available_methods():
+            return {
+                       "status": "Failed",
+                       "message": f"Compile method {args['method']} needs a newer torch; "
+                                  f"available: {', '.join(available_methods())}"
+                   }, 400
+        schedule_compile(args['name'], model_wrapper, args['method'])
+        return {"status": "OK", "message": f"Compilation of {args['name']} scheduled"}, 202
 
 
 @api.route("/models/test")
@@ -150,20 +599,38 @@ class ModelTest(Resource):
         responses={
             201: "Success",
             404: "Model with a given name does not exist",
+            405: "Model is not trained",
             406: "Error while testing model; See description for more info"
         })
     def get(self):
-        __name = parserTrain.parse_args()["name"]
-        args = parserTrain.parse_args()
-        if __name not in MODELS_DICT.keys():
+        args = parserTest.parse_args()
+        if args['name'] not in MODELS_DICT.keys():
             return {
                        "status": "Failed",
                        "message": "Model with a given name does not exist!"
                    }, 404
         else:
             try:
-                MODELS_DICT[__name].test(args["dataset_path"])
-                return {"status": "OK", "message": f"Test score {MODELS_DICT[__name].test_score}"}, 201
+                model_wrapper = MODELS_DICT[args['name']]
+                if not model_wrapper.trained:
+                    return {
+                               "status": "Failed",
+                               "message": "Model is not trained"
+                           }, 405
+                if args['variant'] is not None and args['variant'] not in model_wrapper.variants:
+                    return {
+                               "status": "Failed",
+                               "message": f"Model has no variant {args['variant']}"
+                           }, 404
+                classes, dataloader = build_test_dataloader(args["dataset_path"],
+                                                            args["batch_size"],
+                                                            config.PREDICT_NUM_WORKERS,
+                                                            config.PREDICT_PREFETCH_FACTOR)
+                result = evaluate(model_wrapper, dataloader,
+                                  class_index_map(model_wrapper.id2label, classes),
+                                  top_k=[int(k) for k in args["top_k"].split(',')],
+                                  variant=args['variant'])
+                return {"status": "OK", "result": result}, 201
             except Exception as e:
                 return {
                            "status": "Failed",
@@ -181,7 +648,7 @@ class ModelPredict(Resource):
             407: "Error while predicting result; See description for more info"
         })
     def post(self):
-        args = parserTest.parse_args()
+        args = parserPredict.parse_args()
         if args['name'] not in MODELS_DICT.keys():
             return {
                        "status": "Failed",
@@ -189,11 +656,28 @@ class ModelPredict(Resource):
                    }, 404
         else:
             try:
-                labels = []
-                dataloader = build_predict_dataloader(args['dataset_path'])
-                for x in dataloader:
-                    labels += MODELS_DICT[args['name']].predict(x)
-                predictions = dict(zip(os.listdir(args['dataset_path']), labels))
+                if args['variant'] is not None and args['variant'] not in MODELS_DICT[args['name']].variants:
+                    return {
+                               "status": "Failed",
+                               "message": f"Model has no variant {args['variant']}"
+                           }, 404
+                if args['images']:
+                    return {"result": predict_images(args['name'], args['variant'], args['images'],
+                                                     args['top_k'])}, 201
+                if request.mimetype in ('application/x-npy', 'application/octet-stream'):
+                    return {"result": predict_array(args['name'], args['variant'], request.get_data(),
+                                                    request.mimetype, args['shape'], args['dtype'],
+                                                    args['top_k'])}, 201
+                if args['dataset_path'] is None:
+                    return {
+                               "status": "Failed",
+                               "message": "Either dataset_path, uploaded images or an array body is required"
+                           }, 407
+                if args['stream']:
+                    return Response(stream_with_context(stream_predictions(args['name'], args['variant'],
+                                                                           args['dataset_path'])),
+                                    mimetype='application/x-ndjson')
+                predictions = dict(predict_directory(args['name'], args['variant'], args['dataset_path']))
                 return {"result": predictions}, 201
             except Exception as e:
                 return {
@@ -202,6 +686,161 @@ class ModelPredict(Resource):
                        }, 407
 
 
+@api.route("/models/predict/multi", methods=['POST'])
+class ModelPredictMulti(Resource):
+    @api.expect(parserPredictMulti)
+    @api.doc(
+        responses={
+            201: "Success",
+            404: "Model with a given name does not exist",
+            405: "Model is not trained",
+            407: "Error while predicting result; See description for more info"
+        })
+    def post(self):
+        args = parserPredictMulti.parse_args()
+        names = [name.strip() for name in args['names'].split(',') if name.strip()]
+        missing = [name for name in names if name not in MODELS_DICT.keys()]
+        if not names or missing:
+            return {
+                       "status": "Failed",
+                       "message": f"Models {missing} do not exist!"
+                   }, 404
+        try:
+            model_wrappers = {name: MODELS_DICT[name] for name in names}
+            untrained = [name for name, model_wrapper in model_wrappers.items() if not model_wrapper.trained]
+            if untrained:
+                return {
+                           "status": "Failed",
+                           "message": f"Models {untrained} are not trained"
+                       }, 405
+            dataloader = build_predict_dataloader(args['dataset_path'],
+                                                  config.PREDICT_BATCH_SIZE,
+                                                  config.PREDICT_NUM_WORKERS,
+                                                  config.PREDICT_PREFETCH_FACTOR)
+            predictions = dict(zip(dataloader.dataset.files, predict_shared(model_wrappers, dataloader)))
+            return {"result": predictions}, 201
+        except Exception as e:
+            return {
+                       "status": "Failed",
+                       "message": getattr(e, "message", repr(e))
+                   }, 407
+
+
+@api.route("/models/predict/stats")
+class ModelPredictStats(Resource):
+    @api.doc(responses={201: "Success"})
+    def get(self):
+        return {"batching": {name if variant is None else f"{name}/{variant}": batcher.get_stats()
+                             for (name, variant), batcher in list(BATCHERS.items())},
+                "cache": PREDICTION_CACHE.get_stats()}, 201
+
+
+@api.route("/profiler/start", methods=['POST'])
+class ProfilerStart(Resource):
+    @api.expect(parserProfile)
+    @api.doc(
+        responses={
+            202: "Profiling armed for the next steps",
+            404: "Model with a given name does not exist",
+            409: "Profiling of this model and target is already armed"
+        })
+    def post(self):
+        args = parserProfile.parse_args()
+        if args['name'] not in MODELS_DICT.keys():
+            return {
+                       "status": "Failed",
+                       "message": "Model with a given name does not exist!"
+                   }, 404
+        session = PROFILER.arm(args['name'], args['target'], args['steps'])
+        if session is None:
+            return {
+                       "status": "Failed",
+                       "message": f"Profiling of {args['target']} for this model is already armed"
+                   }, 409
+        return {"status": "OK", "profile_id": session.id,
+                "message": f"Profiling the next {args['steps']} {args['target']} steps of {args['name']}"}, 202
+
+
+@api.route("/profiler/<string:profile_id>")
+class ProfilerStatus(Resource):
+    @api.doc(
+        responses={
+            201: "Success",
+            404: "Profile with a given id does not exist"
+        })
+    def get(self, profile_id):
+        session = PROFILER.get(profile_id)
+        if session is None:
+            return {
+                       "status": "Failed",
+                       "message": "Profile with a given id does not exist"
+                   }, 404
+        return session.get_info(), 201
+
+
+@api.route("/profiler/<string:profile_id>/trace")
+class ProfilerTrace(Resource):
+    @api.doc(
+        responses={
+            200: "Chrome trace",
+            404: "Profile with a given id does not exist or is not finished"
+        })
+    def get(self, profile_id):
+        session = PROFILER.get(profile_id)
+        if session is None or session.status != 'done':
+            return {
+                       "status": "Failed",
+                       "message": "Profile with a given id does not exist or is not finished"
+                   }, 404
+        return send_file(os.path.abspath(session.trace_path), mimetype='application/json',
+                         as_attachment=True, download_name=f"{profile_id}.json")
+
+
+@api.route("/profiler/<string:profile_id>/table")
+class ProfilerTable(Resource):
+    @api.doc(
+        responses={
+            200: "Table of top operators",
+            404: "Profile with a given id does not exist or is not finished"
+        })
+    def get(self, profile_id):
+        session = PROFILER.get(profile_id)
+        if session is None or session.status != 'done':
+            return {
+                       "status": "Failed",
+                       "message": "Profile with a given id does not exist or is not finished"
+                   }, 404
+        return Response(session.table, mimetype='text/plain')
+
+
+@api.route("/models/rollback", methods=['POST'])
+class ModelRollback(Resource):
+    @api.expect(parserRollback)
+    @api.doc(
+        responses={
+            201: "Success",
+            404: "Model or version does not exist"
+        })
+    def post(self):
+        args = parserRollback.parse_args()
+        if args['name'] not in MODELS_DICT.keys():
+            return {
+                       "status": "Failed",
+                       "message": "Model with a given name does not exist!"
+                   }, 404
+        try:
+            model_wrapper = MODELS_DICT.rollback(args['name'], args['version'])
+        except KeyError:
+            return {
+                       "status": "Failed",
+                       "message": f"Model has no version {args['version']}"
+                   }, 404
+        # cached results are keyed by version and stay valid for the restored one
+        if config.COMPILE_AFTER_TRAIN:
+            schedule_compile(args['name'], model_wrapper)
+        return {"status": "OK", "message": f"Model {args['name']} is at version {args['version']}"}, 201
+
+
 @api.route("/models/remove")
 class ModelRemove(Resource):
     @api.expect(parserRemove)
@@ -218,8 +857,17 @@ class ModelRemove(Resource):
                    }, 404
         else:
             MODELS_DICT.pop(__name)
+            with BATCHERS_LOCK:
+                for key in [key for key in BATCHERS if key[0] == __name]:
+                    BATCHERS.pop(key).close()
+            PREDICTION_CACHE.invalidate(__name)
             return {"status": "OK", "message": "Model removed!"}, 201
 
 
+# spawned training workers re-import this module and must not load models
+if config.PRELOAD_MODELS and multiprocessing.parent_process() is None:
+    threading.Thread(target=preload_models, daemon=True, name='preload-models').start()
+
+
 if __name__ == "__main__":
-    app.run(debug=True)
+    app.run(debug=True, threaded=True)
@@ -0,0 +1,93 @@
+import os
+import threading
+
+import torch
+from torch import nn
+
+import config
+from dataloader import to_float_tensor
+
+
+class SharedHeadModel(nn.Module):
+    """A model-specific `fc` head on top of a frozen backbone that is shared with other models."""
+
+    def __init__(self, backbone: nn.Module, fc: nn.Linear):
+        super().__init__()
+        self.backbone = backbone
+        self.fc = fc
+
+    def train(self, mode=True):
+        super().train(mode)
+        # the shared backbone is frozen and stays in eval mode, so training one head never touches its statistics
+        self.backbone.eval()
+        return self
+
+    def forward(self, x):
+        return self.fc(self.backbone(x))
+
+    def head_state_dict(self):
+        return {k: v for k, v in self.state_dict().items() if not k.startswith('backbone.')}
+
+
+class BackbonePool:
+    """One frozen backbone instance per backbone type and device; weights are persisted so they survive restarts."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.backbones = {}
+        self.lock = threading.Lock()
+
+    def get(self, backbone_name, device):
+        key = (backbone_name, device)
+        with self.lock:
+            if key in self.backbones:
+                return self.backbones[key]
+            from torchvision import models
+            backbone = getattr(models, backbone_name)()
+            backbone.out_features = backbone.fc.in_features
+            backbone.fc = nn.Identity()
+            path = os.path.join(self.root, f"{backbone_name}.pt")
+            if os.path.isfile(path):
+                backbone.load_state_dict(torch.load(path, map_location='cpu'))
+            else:
+                os.makedirs(self.root, exist_ok=True)
+                torch.save(backbone.state_dict(), path + '.tmp')
+                os.replace(path + '.tmp', path)
+            for param in backbone.parameters():
+                param.requires_grad = False
+            backbone.eval().to(device)
+            self.backbones[key] = backbone
+            return backbone
+
+    def get_info(self):
+        with self.lock:
+            return {f"{name}/{device}": sum(t.numel() * t.element_size()
+                                            for t in list(backbone.parameters()) + list(backbone.buffers()))
+                    for (name, device), backbone in self.backbones.items()}
+
+
+def predict_shared(model_wrappers: dict, dataloader):
+    """Yields {model name: label} per image; models that share a backbone run it once per batch."""
+    groups = {}
+    for name, model_wrapper in model_wrappers.items():
+        key = id(model_wrapper.model.backbone) if model_wrapper.shared_backbone else name
+        groups.setdefault(key, []).append(name)
+
+    with torch.inference_mode():
+        for x in dataloader:
+            x = to_float_tensor(x)
+            labels = {}
+            for names in groups.values():
+                first = model_wrappers[names[0]]
+                inputs = x.to(first.device)
+                if first.shared_backbone:
+                    features = first.get_features(inputs)
+                    for name in names:
+                        labels[name] = model_wrappers[name].predict_features(features)
+                else:
+                    labels[names[0]] = first.predict(inputs)
+            for i in range(len(x)):
+                yield {name: labels[name][i] for name in model_wrappers}
+
+
+SHARED_BACKBONES = BackbonePool(config.SHARED_BACKBONE_DIR)
@@ -0,0 +1,139 @@
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from typing import Callable
+
+import torch
+
+import profiling
+import telemetry
+from dataloader import to_float_tensor
+from model_wrapper import ModelWrapper
+
+_STOP = object()
+
+
+class BatchingEngine:
+    """Collects single inference items from concurrent requests into batches for one model."""
+
+    def __init__(
+            self,
+            get_model: Callable[[], ModelWrapper],
+            max_batch_size: int = 32,
+            max_wait_ms: float = 5,
+            variant: str = None,
+            name: str = 'unknown'):
+        # resolved per batch so that the engine does not keep an evicted model alive
+        self.get_model = get_model
+        self.variant = variant
+        self.name = name
+        self.label = name if variant is None else f"{name}/{variant}"
+        self.profile_session = None
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.
+        self.queue = queue.Queue()
+        self.batch_sizes = Counter()
+        self.num_batches = 0
+        self.num_items = 0
+        self.thread = threading.Thread(target=self._loop, daemon=True, name='batching-engine')
+        self.thread.start()
+
+    def submit(self, x, top_k=None, model_wrapper=None):
+        """Enqueue one (C, H, W) tensor; the future resolves to its label, or its top-k labels and probabilities.
+
+        Passing the `model_wrapper` a request resolved once pins all of its items to that model version.
+        """
+        future = Future()
+        self.queue.put((x, future, top_k, model_wrapper))
+        return future
+
+    def submit_many(self, batch, top_k=None, model_wrapper=None):
+        return [self.submit(x, top_k, model_wrapper) for x in batch]
+
+    def predict(self, batch, top_k=None, model_wrapper=None):
+        return [future.result() for future in self.submit_many(batch, top_k, model_wrapper)]
+
+    def close(self):
+        self.queue.put(_STOP)
+
+    def _collect(self):
+        item = self.queue.get()
+        if item is _STOP:
+            return None
+        items = [item]
+        deadline = time.perf_counter() + self.max_wait
+        while len(items) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self.queue.put(_STOP)
+                break
+            items.append(item)
+        return items
+
+    def _loop(self):
+        while True:
+            items = self._collect()
+            if items is None:
+                return
+            items = [item for item in items if item[1].set_running_or_notify_cancel()]
+            if not items:
+                continue
+            # items pinned to different model versions, e.g. around a publish, are not mixed in one batch
+            groups = {}
+            for x, future, top_k, model_wrapper in items:
+                groups.setdefault(id(model_wrapper), (model_wrapper, []))[1].append((x, future, top_k))
+            for model_wrapper, group in groups.values():
+                self._run(model_wrapper, group)
+
+    def _run(self, model_wrapper, items):
+        inputs = [x for x, _, _ in items]
+        futures = [future for _, future, _ in items]
+        top_ks = [top_k for _, _, top_k in items]
+        try:
+            if model_wrapper is None:
+                model_wrapper = self.get_model()
+            if self.profile_session is None and profiling.PROFILER.pending:
+                self.profile_session = profiling.PROFILER.take(self.name, 'predict')
+            start = time.perf_counter()
+            if len({x.dtype for x in inputs}) > 1:  # uploaded float arrays batched with decoded images
+                inputs = [to_float_tensor(x) for x in inputs]
+            batch = to_float_tensor(torch.stack(inputs).to(model_wrapper.device))
+            max_k = max((k for k in top_ks if k is not None), default=None)
+            with torch.inference_mode():
+                labels = model_wrapper.predict(batch, self.variant, top_k=max_k)
+            if max_k is not None:
+                labels = [result["labels"][0] if k is None else
+                          {"labels": result["labels"][:k], "probs": result["probs"][:k]}
+                          for result, k in zip(labels, top_ks)]
+            elapsed = time.perf_counter() - start
+            if self.profile_session is not None and self.profile_session.step():
+                self.profile_session = None
+            telemetry.PREDICT_IMAGES.inc(len(inputs), model=self.label)
+            telemetry.PREDICT_SECONDS.inc(elapsed, model=self.label)
+            if elapsed > 0:
+                telemetry.PREDICT_IMAGES_PER_SECOND.set(len(inputs) / elapsed, model=self.label)
+            for future, label in zip(futures, labels):
+                future.set_result(label)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+        self.batch_sizes[len(inputs)] += 1
+        self.num_batches += 1
+        self.num_items += len(inputs)
+
+    def get_stats(self):
+        return {"queue_depth": self.queue.qsize(),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.,
+                "num_batches": self.num_batches,
+                "num_items": self.num_items,
+                "mean_batch_size": self.num_items / self.num_batches if self.num_batches else 0.,
+                "batch_sizes": {str(size): count for size, count in sorted(self.batch_sizes.items())}}
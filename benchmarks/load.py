@@ -0,0 +1,57 @@
+import json
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+def load_trace(path, **substitutions):
+    """Reads a JSONL trace of {"method", "path", "query"} requests; `{name}` placeholders in query values are filled in."""
+    trace = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                request = json.loads(line)
+                request["query"] = {k: v.format(**substitutions) if isinstance(v, str) else v
+                                    for k, v in request.get("query", {}).items()}
+                trace.append(request)
+    return trace
+
+
+def summarize(latencies, elapsed):
+    latencies = np.asarray(latencies) * 1000.
+    return {"requests": int(latencies.size),
+            "throughput_rps": latencies.size / elapsed if elapsed > 0 else 0.,
+            "mean_ms": float(latencies.mean()),
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "p99_ms": float(np.percentile(latencies, 99))}
+
+
+def replay(flask_app, trace, concurrency=4, repeat=1):
+    """Replays `trace` against `flask_app` in-process and reports latency percentiles per endpoint."""
+    client_requests = [request for _ in range(repeat) for request in trace]
+    latencies = defaultdict(list)
+    statuses = defaultdict(lambda: defaultdict(int))
+
+    def send(request):
+        client = flask_app.test_client()
+        start = time.perf_counter()
+        response = client.open(request["path"], method=request.get("method", "GET"),
+                               query_string=request.get("query"))
+        response.get_data()
+        return request["path"], response.status_code, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for path, status, latency in executor.map(send, client_requests):
+            latencies[path].append(latency)
+            statuses[path][str(status)] += 1
+    elapsed = time.perf_counter() - start
+
+    return {"concurrency": concurrency,
+            "elapsed_seconds": elapsed,
+            "total": summarize([l for values in latencies.values() for l in values], elapsed),
+            "endpoints": {path: dict(summarize(values, elapsed), status_codes=dict(statuses[path]))
+                          for path, values in latencies.items()}}
@@ -0,0 +1,63 @@
+import time
+
+import torch
+
+from dataloader import build_predict_dataloader, build_train_dataloader
+from model_wrapper import ModelWrapper
+from trainer import Trainer
+
+
+def _timed_epoch(dataloader):
+    start = time.perf_counter()
+    n = 0
+    for batch in dataloader:
+        inputs = batch[0] if isinstance(batch, (list, tuple)) else batch
+        n += inputs.size(0)
+    elapsed = time.perf_counter() - start
+    return {"images": n, "seconds": elapsed, "images_per_sec": n / elapsed if elapsed > 0 else 0.}
+
+
+def bench_train_dataloader(path, batch_size=32, valid_part=0.1, cache=None, epochs=2):
+    start = time.perf_counter()
+    _, dataloaders = build_train_dataloader(path, batch_size, valid_part, cache=cache)
+    build_seconds = time.perf_counter() - start
+    return {"build_seconds": build_seconds,
+            "epochs": [_timed_epoch(dataloaders['train']) for _ in range(epochs)]}
+
+
+def bench_predict_dataloader(path, batch_size=16, num_workers=0):
+    start = time.perf_counter()
+    dataloader = build_predict_dataloader(path, batch_size, num_workers)
+    build_seconds = time.perf_counter() - start
+    return dict(_timed_epoch(dataloader), build_seconds=build_seconds)
+
+
+def bench_trainer(path, backbone_name='resnet18', epochs=2, batch_size=32, **config):
+    id2label, dataloaders = build_train_dataloader(path, batch_size)
+    train_config = {'optimizer_name': 'Adam', 'lr': 0.001, 'freeze_backbone': True}
+    train_config.update(config)
+    trainer = Trainer(train_config, ModelWrapper(backbone_name, 'cpu'), dataloaders, id2label)
+    start = time.perf_counter()
+    trainer.train(epochs)
+    return {"config": train_config,
+            "seconds": time.perf_counter() - start,
+            "metrics": trainer.metrics}
+
+
+@torch.inference_mode()
+def bench_predict(backbone_name='resnet18', batch_sizes=(1, 4, 16, 32), repeats=5, num_classes=4):
+    model_wrapper = ModelWrapper(backbone_name, 'cpu')
+    model_wrapper.init_model([str(i) for i in range(num_classes)], True)
+    model_wrapper.eval()
+    results = {}
+    for bs in batch_sizes:
+        x = torch.rand(bs, 3, 224, 224)
+        model_wrapper.predict(x)  # warm-up
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            model_wrapper.predict(x)
+            timings.append(time.perf_counter() - start)
+        median = sorted(timings)[len(timings) // 2]
+        results[str(bs)] = {"median_ms": median * 1000., "images_per_sec": bs / median}
+    return results
@@ -0,0 +1,125 @@
+"""Offline benchmark suite.
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --output new.json --baseline results.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from benchmarks.startup import measure_startup
+from benchmarks.synthetic import make_image_directory, make_image_folder
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_TRACE = os.path.join(REPO_ROOT, 'benchmarks', 'default_trace.jsonl')
+
+
+def run_load(args, dataset_dir, predict_dir):
+    import app
+    from benchmarks.load import load_trace, replay
+    from trainer import Trainer
+    from dataloader import build_train_dataloader
+
+    model_name = 'bench_model'
+    if model_name not in app.MODELS_DICT:
+        app.MODELS_DICT[model_name] = app.ModelWrapper(args.backbone, 'cpu')
+    model_wrapper = app.MODELS_DICT[model_name]
+    id2label, dataloaders = build_train_dataloader(dataset_dir, args.batch_size)
+    Trainer({'optimizer_name': 'Adam', 'lr': 0.001, 'freeze_backbone': True},
+            model_wrapper, dataloaders, id2label).train(1)
+    app.MODELS_DICT.save(model_name, model_wrapper)
+
+    trace = load_trace(args.trace, model_name=model_name, dataset_dir=dataset_dir, predict_dir=predict_dir)
+    return {str(c): replay(app.app, trace, concurrency=c, repeat=args.repeat) for c in args.concurrency}
+
+
+def run_micro(args, dataset_dir, predict_dir):
+    from benchmarks import micro
+    return {"train_dataloader": micro.bench_train_dataloader(dataset_dir, args.batch_size),
+            "predict_dataloader": micro.bench_predict_dataloader(predict_dir),
+            "trainer": micro.bench_trainer(dataset_dir, args.backbone, args.epochs, args.batch_size),
+            "predict": micro.bench_predict(args.backbone)}
+
+
+def compare(results, baseline, threshold):
+    """Lists numbers that got worse by more than `threshold` (relative) compared with `baseline`."""
+    regressions = []
+
+    def walk(new, old, path):
+        if isinstance(new, dict) and isinstance(old, dict):
+            for key in new.keys() & old.keys():
+                walk(new[key], old[key], path + [str(key)])
+        elif isinstance(new, (int, float)) and isinstance(old, (int, float)) and old:
+            name = path[-1]
+            higher_is_better = name.endswith('per_sec') or name.endswith('_rps')
+            lower_is_better = name.endswith('_ms') or name.endswith('seconds')
+            change = (new - old) / abs(old)
+            if (higher_is_better and change < -threshold) or (lower_is_better and change > threshold):
+                regressions.append({"metric": '.'.join(path), "baseline": old, "current": new, "change": change})
+
+    walk(results, baseline, [])
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', default=None, help="Earlier results to check for regressions")
+    parser.add_argument('--threshold', type=float, default=0.1, help="Relative change counted as a regression")
+    parser.add_argument('--classes', type=int, default=4)
+    parser.add_argument('--images-per-class', type=int, default=32)
+    parser.add_argument('--predict-images', type=int, default=64)
+    parser.add_argument('--backbone', default='resnet18')
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--epochs', type=int, default=2)
+    parser.add_argument('--trace', default=DEFAULT_TRACE)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--repeat', type=int, default=2)
+    parser.add_argument('--skip-load', action='store_true')
+    parser.add_argument('--skip-micro', action='store_true')
+    parser.add_argument('--skip-startup', action='store_true')
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.output)
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    args.trace = os.path.abspath(args.trace)
+    sys.path.insert(0, REPO_ROOT)
+    with tempfile.TemporaryDirectory() as workdir:
+        # the app keeps its model store and caches relative to the working directory
+        os.chdir(workdir)
+        dataset_dir = make_image_folder(os.path.join(workdir, 'train'), args.classes, args.images_per_class)
+        predict_dir = make_image_directory(os.path.join(workdir, 'predict'), args.predict_images) + os.sep
+
+        import torch
+        results = {"meta": {"time": time.time(),
+                            "python": platform.python_version(),
+                            "torch": torch.__version__,
+                            "threads": torch.get_num_threads(),
+                            "args": {k: v for k, v in vars(args).items() if k not in ('output', 'baseline')}}}
+        if not args.skip_startup:
+            results["startup"] = measure_startup()
+        if not args.skip_micro:
+            results["micro"] = run_micro(args, dataset_dir, predict_dir)
+        if not args.skip_load:
+            results["load"] = run_load(args, dataset_dir, predict_dir)
+        os.chdir(REPO_ROOT)
+
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {output}")
+
+    if baseline is not None:
+        with open(baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for r in regressions:
+            print("regression: {metric} {baseline:.4g} -> {current:.4g} ({change:+.1%})".format(**r))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,60 @@
+"""Measures how long importing the app takes in a fresh interpreter.
+
+    python -m benchmarks.startup --check
+
+With --check the exit code is 1 if the median import time exceeds STARTUP_TIME_BUDGET_SECONDS
+or if modules that must be imported lazily were loaded.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAZY_MODULES = ('wandb', 'torchvision')
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds, "loaded": [m for m in %r if m in sys.modules]}))
+"""
+
+
+def measure_startup(runs=3):
+    samples = []
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get('PYTHONPATH')])))
+        for _ in range(runs):
+            output = subprocess.run([sys.executable, '-c', _PROBE % (LAZY_MODULES,)], cwd=workdir, env=env,
+                                    check=True, capture_output=True, text=True).stdout
+            samples.append(json.loads(output.strip().splitlines()[-1]))
+    seconds = sorted(sample["seconds"] for sample in samples)
+    return {"runs": runs,
+            "median_seconds": seconds[len(seconds) // 2],
+            "max_seconds": seconds[-1],
+            "eagerly_loaded": sorted({m for sample in samples for m in sample["loaded"]})}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--budget', type=float, default=None, help="Seconds; STARTUP_TIME_BUDGET_SECONDS if empty")
+    parser.add_argument('--check', action='store_true')
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, REPO_ROOT)
+    import config
+    budget = args.budget if args.budget is not None else config.STARTUP_TIME_BUDGET_SECONDS
+    result = dict(measure_startup(args.runs), budget_seconds=budget)
+    print(json.dumps(result, indent=2))
+    if args.check and (result["median_seconds"] > budget or result["eagerly_loaded"]):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
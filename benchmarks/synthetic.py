@@ -0,0 +1,29 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+
+def make_image_folder(root, num_classes=4, images_per_class=32, image_size=(256, 256), seed=0):
+    """Writes a torchvision ImageFolder layout of random JPEGs: root/class_<i>/<j>.jpg."""
+    rng = np.random.default_rng(seed)
+    for c in range(num_classes):
+        class_dir = os.path.join(root, f"class_{c}")
+        os.makedirs(class_dir, exist_ok=True)
+        # a per-class mean color keeps the classes learnable
+        mean = rng.integers(0, 256, size=3)
+        for i in range(images_per_class):
+            noise = rng.normal(0, 40, size=(image_size[0], image_size[1], 3))
+            pixels = np.clip(mean + noise, 0, 255).astype(np.uint8)
+            Image.fromarray(pixels).save(os.path.join(class_dir, f"{i}.jpg"), quality=90)
+    return root
+
+
+def make_image_directory(root, num_images=64, image_size=(256, 256), seed=1):
+    """Writes a flat directory of random JPEGs as used by /models/predict."""
+    rng = np.random.default_rng(seed)
+    os.makedirs(root, exist_ok=True)
+    for i in range(num_images):
+        pixels = rng.integers(0, 256, size=(image_size[0], image_size[1], 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(os.path.join(root, f"{i}.jpg"), quality=90)
+    return root
@@ -0,0 +1,67 @@
+import copy
+import time
+
+import torch
+
+from dataloader import IMAGE_SIZE
+from model_wrapper import ModelWrapper
+
+COMPILE_METHODS = ('torchscript', 'compile')
+
+
+def available_methods():
+    # torch.compile only exists from torch 2.0 on
+    return tuple(method for method in COMPILE_METHODS if method != 'compile' or hasattr(torch, 'compile'))
+
+
+@torch.no_grad()
+def _median_latency(module, x, repeats=5):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        module(x)
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2]
+
+
+def compile_model(
+        model_wrapper: ModelWrapper,
+        method: str = 'torchscript',
+        batch_sizes=(1, 4, 16, 32),
+        warmup_iters: int = 3):
+    """Builds a graph-optimized copy of the model and warms it up on the batch sizes that are served.
+
+    `torchscript` traces the model and freezes it with torch.jit.freeze, `compile` uses torch.compile.
+    """
+    if method not in available_methods():
+        raise ValueError(f"Unsupported compile method {method}; expected one of {available_methods()}")
+    device = model_wrapper.device
+    model = copy.deepcopy(model_wrapper.model).eval()
+    examples = {bs: torch.rand(bs, 3, *IMAGE_SIZE, device=device) for bs in batch_sizes}
+
+    start = time.perf_counter()
+    with torch.no_grad():
+        if method == 'torchscript':
+            module = torch.jit.freeze(torch.jit.trace(model, examples[batch_sizes[0]]))
+        else:
+            module = torch.compile(model)
+        # the first calls for every shape pay for graph optimization, kernel selection and allocator growth
+        for x in examples.values():
+            for _ in range(warmup_iters):
+                module(x)
+    prepare_seconds = time.perf_counter() - start
+
+    latency = {}
+    for bs, x in examples.items():
+        eager = _median_latency(model, x)
+        compiled = _median_latency(module, x)
+        latency[str(bs)] = {"eager_ms": eager * 1000.,
+                            "compiled_ms": compiled * 1000.,
+                            "speedup": eager / compiled if compiled > 0 else None}
+
+    info = {"method": method,
+            "device": device,
+            "prepare_seconds": prepare_seconds,
+            "latency": latency,
+            "size_bytes": sum(p.numel() * p.element_size() for p in model.parameters())}
+    return module, info
@@ -0,0 +1,52 @@
+# background training jobs
+TRAIN_WORKERS = 2
+MAX_QUEUED_JOBS = 16
+# finished jobs are kept for /jobs queries up to this count and age
+MAX_FINISHED_JOBS = 100
+FINISHED_JOB_TTL_SECONDS = 24 * 3600
+
+# dynamic micro-batching for /models/predict
+BATCH_MAX_SIZE = 32
+BATCH_MAX_WAIT_MS = 5
+
+# /models/predict image loading
+PREDICT_BATCH_SIZE = 16
+PREDICT_NUM_WORKERS = 2
+PREDICT_PREFETCH_FACTOR = 2
+
+# on-disk cache of preprocessed training tensors
+TENSOR_CACHE_DIR = '.cache/tensors'
+TENSOR_CACHE_BUDGET_BYTES = 8 * 1024 ** 3
+
+# penultimate-layer features for head-only training with a frozen backbone
+EMBEDDING_CACHE_DIR = '.cache/embeddings'
+
+# persisted models; loaded models are evicted least recently used first above the budget
+MODEL_STORE_DIR = 'models_store'
+MODEL_MEMORY_BUDGET_BYTES = 4 * 1024 ** 3
+# frozen backbones shared by models trained with share_backbone=true
+SHARED_BACKBONE_DIR = 'models_store/backbones'
+
+# graph-optimized inference module built in the background after training
+COMPILE_AFTER_TRAIN = True
+COMPILE_METHOD = 'torchscript'
+COMPILE_BATCH_SIZES = (1, 4, 16, 32)
+
+# cache of prediction results keyed by model version and image content
+PREDICTION_CACHE_MAX_ENTRIES = 100000
+PREDICTION_CACHE_MAX_BYTES = 64 * 1024 ** 2
+
+# chrome traces of on-demand torch.profiler captures
+PROFILE_DIR = 'profiles'
+
+# startup: persisted models are loaded in the background until the memory budget is filled
+PRELOAD_MODELS = True
+STARTUP_TIME_BUDGET_SECONDS = 5.
+
+# persistent per-dataset file index; train/valid splits are stratified and shuffled with this seed
+MANIFEST_DIR = '.cache/manifests'
+DATASET_SPLIT_SEED = 0
+
+# local experiment tracking store, written in batches by a background thread
+TRACKING_DB = '.cache/tracking.sqlite'
+TRACKING_FLUSH_INTERVAL_SECONDS = 1.
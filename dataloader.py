@@ -1,45 +1,181 @@
+import io
 import os
+import warnings
+from functools import partial
 
 import numpy as np
 import torch
-import torchvision
-from torchvision.transforms import transforms
+from torch.utils.data.distributed import DistributedSampler
 from PIL import Image
 
-
-def build_train_dataloader(path, batch_size, valid_part=0.1, transform=None):
-    if transform is None:
-        transform = transforms.Compose(
-            [transforms.Resize((224,224)), transforms.ToTensor()])
-
-    dataset = torchvision.datasets.ImageFolder(path, transform=transform)
+import config
+from manifest import IMG_EXTENSIONS, load_manifest
+from tensor_cache import CachedImageDataset, dataset_fingerprint
+
+IMAGE_SIZE = (224, 224)
+
+
+def build_train_dataloader(path, batch_size, valid_part=0.1, transform=None, cache=None, rank=None, world_size=None,
+                           seed=config.DATASET_SPLIT_SEED):
+    # the manifest replaces the ImageFolder directory walk; only changed directories are listed again
+    manifest = load_manifest(path, config.MANIFEST_DIR)
+    dataset = None
+    if transform is None and cache is not None:
+        dataset = build_cached_dataset(path, cache, manifest=manifest)
+    if dataset is None:
+        if transform is None:
+            from torchvision.transforms import transforms
+            transform = transforms.Compose(
+                [transforms.Resize((224,224)), transforms.ToTensor()])
+        dataset = ImageListDataset(manifest.samples, manifest.classes, transform)
     id2label = dataset.classes
-    n = len(dataset)
-    n_valid = int(valid_part * n)
-    valid_dataset = torch.utils.data.Subset(dataset, range(n_valid))  # take first 10%
-    train_dataset = torch.utils.data.Subset(dataset, range(n_valid, n))  # take the rest
-
-    dataloaders = {'train': torch.utils.data.DataLoader(train_dataset, batch_size=batch_size),
+    train_indices, valid_indices = manifest.split(valid_part, seed)
+    valid_dataset = torch.utils.data.Subset(dataset, valid_indices)
+    train_dataset = torch.utils.data.Subset(dataset, train_indices)
+
+    if world_size is not None:
+        # every process of a data-parallel run gets its own shard of both splits; the train shards are
+        # reshuffled every epoch through set_epoch
+        dataloaders = {phase: torch.utils.data.DataLoader(
+                           dataset, batch_size=batch_size,
+                           sampler=DistributedSampler(dataset, num_replicas=world_size, rank=rank,
+                                                      shuffle=phase == 'train', seed=seed))
+                       for phase, dataset in [('train', train_dataset), ('valid', valid_dataset)]}
+        return id2label, dataloaders
+
+    # the split is ordered by class, so the train batches are shuffled, seeded like the split
+    dataloaders = {'train': torch.utils.data.DataLoader(train_dataset, batch_size=batch_size, shuffle=True,
+                                                        generator=torch.Generator().manual_seed(seed)),
                    'valid': torch.utils.data.DataLoader(valid_dataset, batch_size=batch_size)}
 
     return id2label, dataloaders
 
 
-def build_predict_dataloader(path, batch_size=4):
-    transform = transforms.Resize((224, 224))
-    tensors = []
-    for img_path in os.listdir(path):
-        img = np.array(Image.open(path + img_path))
-        img = img / img.max()
-        t = torch.tensor(img).permute(2, 1, 0).float()
-        tensors.append(transform(t))
-
-    dataloader = torch.utils.data.DataLoader(tensors, batch_size=batch_size)
+def build_cached_dataset(path, cache, size=IMAGE_SIZE, manifest=None):
+    if manifest is None:
+        manifest = load_manifest(path, config.MANIFEST_DIR)
+    # the manifest misses files overwritten in place, so the cache key stats every file itself
+    key = dataset_fingerprint(path, manifest.samples, f"load_image(size={size})")
+    entry_dir = cache.open(key, len(manifest.samples), size)
+    if entry_dir is None:  # does not fit into the cache budget
+        return None
+    dataset = CachedImageDataset(manifest.samples, entry_dir, partial(load_image, size=size))
+    dataset.classes = manifest.classes
+    return dataset
+
+
+class ImageListDataset(torch.utils.data.Dataset):
+    """(transformed image, label) for a list of (file, label) samples, like ImageFolder without the directory walk.
+
+    Without a transform, images are decoded with `load_image` into uint8 tensors.
+    """
+
+    def __init__(self, samples, classes, transform=None):
+        self.samples = samples
+        self.targets = [label for _, label in samples]
+        self.classes = classes
+        self.transform = transform
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, idx):
+        file, label = self.samples[idx]
+        if self.transform is None:
+            return load_image(file), label
+        with open(file, 'rb') as f:
+            img = Image.open(f).convert('RGB')
+        return self.transform(img), label
+
+
+def list_images(path):
+    return sorted(f for f in os.listdir(path)
+                  if f.lower().endswith(IMG_EXTENSIONS) and os.path.isfile(os.path.join(path, f)))
+
+
+class ImageDirectoryDataset(torch.utils.data.Dataset):
+    def __init__(self, path, size=IMAGE_SIZE, files=None):
+        self.path = path
+        self.size = size
+        self.files = list_images(path) if files is None else files
+
+    def __len__(self):
+        return len(self.files)
+
+    def __getitem__(self, idx):
+        return load_image(os.path.join(self.path, self.files[idx]), self.size)
+
+
+def load_image(fp, size=IMAGE_SIZE):
+    img = Image.open(fp)
+    # JPEG can be decoded at 1/2, 1/4 or 1/8 scale which is much cheaper than a full decode
+    img.draft('RGB', (size[1], size[0]))
+    img = img.convert('RGB').resize((size[1], size[0]), Image.BILINEAR)
+    return torch.from_numpy(np.array(img, dtype=np.uint8)).permute(2, 0, 1)
+
+
+def to_float_tensor(x):
+    if x.dtype == torch.uint8:
+        return x.float().div_(255)
+    return x
+
+
+def tensor_from_npy(buffer):
+    """Wraps an .npy payload as a tensor without copying the array data."""
+    stream = io.BytesIO(buffer)
+    version = np.lib.format.read_magic(stream)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(stream)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(stream)
+    if fortran_order:
+        raise ValueError("Fortran-ordered arrays are not supported")
+    return tensor_from_buffer(buffer, shape, dtype, offset=stream.tell())
+
+
+def tensor_from_buffer(buffer, shape, dtype='uint8', offset=0):
+    """Wraps raw (N, 3, H, W) or (3, H, W) image data of `dtype` as a uint8 or float32 tensor without copying."""
+    dtype = np.dtype(dtype)
+    if dtype not in (np.dtype(np.uint8), np.dtype(np.float32)):
+        raise ValueError(f"Unsupported dtype {dtype}; expected uint8 or little-endian float32")
+    shape = tuple(shape)
+    if len(shape) == 3:
+        shape = (1,) + shape
+    if len(shape) != 4 or shape[1:] != (3,) + IMAGE_SIZE:
+        raise ValueError(f"Unsupported shape {shape}; expected (N, 3, {IMAGE_SIZE[0]}, {IMAGE_SIZE[1]})")
+    count = int(np.prod(shape))
+    if len(buffer) - offset != count * dtype.itemsize:
+        raise ValueError(f"Payload of {len(buffer) - offset} bytes does not match shape {shape} and dtype {dtype}")
+    array = np.frombuffer(buffer, dtype=dtype, count=count, offset=offset).reshape(shape)
+    with warnings.catch_warnings():
+        # the request body is read-only; the tensor is only read before it is converted or stacked
+        warnings.simplefilter('ignore', UserWarning)
+        return torch.from_numpy(array)
+
+
+def build_predict_dataloader(path, batch_size=4, num_workers=0, prefetch_factor=2, files=None):
+    dataset = ImageDirectoryDataset(path, files=files)
+    kwargs = {'num_workers': min(num_workers, len(dataset))}
+    if kwargs['num_workers'] > 0:
+        kwargs['prefetch_factor'] = prefetch_factor
+    dataloader = torch.utils.data.DataLoader(dataset, batch_size=batch_size, **kwargs)
 
     return dataloader
 
 
+def build_test_dataloader(path, batch_size=16, num_workers=0, prefetch_factor=2):
+    """Loads a labelled dataset (one subdirectory per class) for evaluation; returns (classes, dataloader)."""
+    manifest = load_manifest(path, config.MANIFEST_DIR)
+    dataset = ImageListDataset(manifest.samples, manifest.classes)
+    kwargs = {'num_workers': min(num_workers, len(dataset))}
+    if kwargs['num_workers'] > 0:
+        kwargs['prefetch_factor'] = prefetch_factor
+    return manifest.classes, torch.utils.data.DataLoader(dataset, batch_size=batch_size, **kwargs)
+
+
 def build_cifar_dataloader(batch_size):
+    import torchvision
+    from torchvision.transforms import transforms
 
     transform = transforms.Compose(
         [transforms.ToTensor()])
@@ -0,0 +1,128 @@
+import os
+import queue
+import socket
+import tempfile
+
+import torch
+import torch.multiprocessing as mp
+from torch import distributed as dist
+from torch.nn.parallel import DistributedDataParallel
+
+from dataloader import build_train_dataloader
+from model_wrapper import ModelWrapper
+from tensor_cache import TensorCache
+from trainer import Trainer, TrainingCancelled
+
+
+class DistributedProgress:
+    """Stands in for a Trainer in the parent process; metrics arrive from rank 0 after every epoch."""
+
+    def __init__(self):
+        self.metrics = {}
+        self.last_record = 0.
+        self.best_epoch = None
+        self.stopped_epoch = None
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _worker(rank, world_size, threads_per_process, port, model_wrapper, train_config, data_args, num_epochs,
+            progress_queue, result_path):
+    torch.set_num_threads(threads_per_process)
+    os.environ['MASTER_ADDR'] = '127.0.0.1'
+    os.environ['MASTER_PORT'] = str(port)
+    dist.init_process_group('gloo', rank=rank, world_size=world_size)
+    try:
+        cache = None
+        if data_args['cache_dir'] is not None:
+            cache = TensorCache(data_args['cache_dir'], data_args['cache_budget_bytes'])
+
+        def build():
+            return build_train_dataloader(data_args['dataset_path'], data_args['batch_size'], data_args['valid_part'],
+                                          cache=cache, rank=rank, world_size=world_size)
+
+        # rank 0 creates the tensor cache entry before the other ranks open it
+        if rank == 0:
+            id2label, dataloaders = build()
+        dist.barrier()
+        if rank != 0:
+            id2label, dataloaders = build()
+
+        trainer = Trainer(dict(train_config, precompute_embeddings=False), model_wrapper, dataloaders, id2label)
+        trainer.ddp_model = DistributedDataParallel(model_wrapper.model)
+        if rank == 0:
+            trainer.epoch_callback = lambda epoch, metrics: progress_queue.put(metrics)
+        trainer.train(num_epochs)
+
+        if rank == 0:
+            model = model_wrapper.model
+            torch.save({"state_dict": model.head_state_dict() if model_wrapper.shared_backbone else model.state_dict(),
+                        "id2label": id2label,
+                        "metrics": trainer.metrics,
+                        "last_record": trainer.last_record,
+                        "best_epoch": trainer.best_epoch,
+                        "stopped_epoch": trainer.stopped_epoch}, result_path)
+    finally:
+        dist.destroy_process_group()
+
+
+def train_distributed(
+        model_wrapper: ModelWrapper,
+        train_config: dict,
+        data_args: dict,
+        num_epochs: int,
+        num_processes: int,
+        threads_per_process: int = None,
+        stop_event=None,
+        progress: DistributedProgress = None):
+    """Trains `model_wrapper` with DistributedDataParallel over gloo in `num_processes` CPU processes.
+
+    The trained weights are loaded back into `model_wrapper` in the calling process.
+    """
+    if not model_wrapper.device.startswith('cpu'):
+        raise ValueError("Data-parallel training over gloo is only supported for models on cpu")
+    if threads_per_process is None:
+        threads_per_process = max(1, (os.cpu_count() or 1) // num_processes)
+    if progress is None:
+        progress = DistributedProgress()
+
+    ctx = mp.get_context('spawn')
+    progress_queue = ctx.Queue()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        result_path = os.path.join(tmp_dir, 'result.pt')
+        context = mp.spawn(_worker,
+                           args=(num_processes, threads_per_process, _free_port(), model_wrapper, train_config,
+                                 data_args, num_epochs, progress_queue, result_path),
+                           nprocs=num_processes,
+                           join=False)
+        while not context.join(timeout=0.5):
+            if stop_event is not None and stop_event.is_set():
+                for process in context.processes:
+                    if process.is_alive():
+                        process.terminate()
+                # reap the workers before the temporary directory they write to is removed
+                for process in context.processes:
+                    process.join()
+                raise TrainingCancelled()
+            try:
+                while True:
+                    progress.metrics = progress_queue.get_nowait()
+            except queue.Empty:
+                pass
+        result = torch.load(result_path)
+
+    model_wrapper.init_model(result["id2label"], train_config['freeze_backbone'],
+                             train_config.get('share_backbone', False))
+    # with a shared backbone rank 0 only sends the head
+    model_wrapper.model.load_state_dict(result["state_dict"], strict=not model_wrapper.shared_backbone)
+    model_wrapper.trained = True
+    model_wrapper.eval()
+    progress.metrics = result["metrics"]
+    progress.last_record = result["last_record"]
+    progress.best_epoch = result["best_epoch"]
+    progress.stopped_epoch = result["stopped_epoch"]
+    return progress
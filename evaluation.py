@@ -0,0 +1,72 @@
+import time
+
+import torch
+from torch.nn import functional as F
+
+from dataloader import to_float_tensor
+from model_wrapper import ModelWrapper
+
+
+def class_index_map(model_classes, dataset_classes):
+    """Maps dataset label indices to the model's label indices by class name."""
+    unknown = [name for name in dataset_classes if name not in model_classes]
+    if unknown:
+        raise ValueError(f"Test classes {unknown} are unknown to the model")
+    return torch.tensor([model_classes.index(name) for name in dataset_classes], dtype=torch.long)
+
+
+def evaluate(model_wrapper: ModelWrapper, dataloader, class_map=None, top_k=(1, 5), variant=None):
+    """Evaluates the model in a single pass over `dataloader`.
+
+    Only the confusion matrix, top-k hit counts and the loss sum are accumulated on the device,
+    so the test set is never held in memory.
+    """
+    n = len(model_wrapper.id2label)
+    device = torch.device(model_wrapper.device)
+    if variant is None:
+        variant = model_wrapper.default_variant
+    top_k = sorted({k for k in top_k if k >= 1})
+    max_k = min(max(top_k, default=1), n)
+    k_columns = torch.tensor([min(k, n) - 1 for k in top_k], dtype=torch.long, device=device)
+    if class_map is not None:
+        class_map = class_map.to(device)
+
+    confusion = torch.zeros(n * n, dtype=torch.long, device=device)
+    top_k_hits = torch.zeros(len(top_k), dtype=torch.long, device=device)
+    loss_sum = torch.zeros((), device=device)
+    start = time.perf_counter()
+
+    model_wrapper.eval()
+    with torch.inference_mode():
+        for inputs, labels in dataloader:
+            inputs = to_float_tensor(inputs.to(device, non_blocking=True))
+            labels = labels.to(device, non_blocking=True)
+            if class_map is not None:
+                labels = class_map[labels]
+            logits = model_wrapper.get_logits(inputs, variant).to(device).float()
+            preds = logits.argmax(1)
+            confusion += torch.bincount(labels * n + preds, minlength=n * n)
+            hits = (logits.topk(max_k, 1).indices == labels[:, None]).cumsum(1)
+            top_k_hits += hits.index_select(1, k_columns).sum(0)
+            loss_sum += F.cross_entropy(logits, labels, reduction='sum')
+
+    elapsed = time.perf_counter() - start
+    confusion = confusion.view(n, n).cpu()
+    total = int(confusion.sum())
+    if total == 0:
+        raise ValueError("Test dataset is empty")
+    true_positives = confusion.diag()
+    precision = true_positives.double() / confusion.sum(0).clamp_min(1)
+    recall = true_positives.double() / confusion.sum(1).clamp_min(1)
+    support = confusion.sum(1)
+    return {"samples": total,
+            "accuracy": true_positives.sum().item() / total,
+            "loss": loss_sum.item() / total,
+            "top_k_accuracy": {str(k): hits / total for k, hits in zip(top_k, top_k_hits.tolist())},
+            "per_class": {name: {"precision": precision[i].item(),
+                                 "recall": recall[i].item(),
+                                 "support": support[i].item()}
+                          for i, name in enumerate(model_wrapper.id2label)},
+            "confusion_matrix": {"labels": list(model_wrapper.id2label),
+                                 "rows_true_columns_predicted": confusion.tolist()},
+            "images_per_sec": total / elapsed if elapsed > 0 else 0.}
@@ -0,0 +1,127 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from trainer import TrainingCancelled
+
+
+class Job:
+    def __init__(self, model_name: str, params: dict):
+        self.id = uuid.uuid4().hex
+        self.model_name = model_name
+        self.params = params
+        self.status = 'queued'
+        self.message = None
+        self.result = None
+        self.trainer = None
+        # progress at the end of the job; the trainer with its model copy and data is released then
+        self.final_progress = None
+        self.epochs_numb = params.get('epochs_numb')
+        self.stop_event = threading.Event()
+        self.future = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def done(self):
+        return self.status in ('completed', 'failed', 'cancelled')
+
+    def progress(self):
+        if self.final_progress is not None:
+            return self.final_progress
+        if self.trainer is None:
+            return {'epoch': 0, 'epochs_numb': self.epochs_numb, 'metrics': {}}
+        metrics = {phase: {name: [float(v) for v in values] for name, values in phase_metrics.items()}
+                   for phase, phase_metrics in self.trainer.metrics.items()}
+        return {'epoch': len(metrics.get('valid', {}).get('loss', [])),
+                'epochs_numb': self.epochs_numb,
+                'metrics': metrics,
+                'stage_seconds': getattr(self.trainer, 'stage_seconds', None)}
+
+    def get_info(self):
+        return {'job_id': self.id,
+                'model_name': self.model_name,
+                'status': self.status,
+                'message': self.message,
+                'result': self.result,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'progress': self.progress()}
+
+
+class JobScheduler:
+    def __init__(self, max_workers: int, max_queued: int, max_finished: int = 100, finished_ttl: float = None):
+        self.max_queued = max_queued
+        self.max_finished = max_finished
+        self.finished_ttl = finished_ttl
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='train-job')
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def active_job(self, model_name):
+        with self.lock:
+            for job in self.jobs.values():
+                if job.model_name == model_name and not job.done:
+                    return job
+        return None
+
+    def submit(self, model_name, params, fn):
+        """Enqueue `fn(job)` on the worker pool; returns None if the queue is full."""
+        with self.lock:
+            pending = sum(1 for job in self.jobs.values() if not job.done)
+            if pending >= self.max_queued:
+                return None
+            job = Job(model_name, params)
+            self.jobs[job.id] = job
+            self._prune()
+        job.future = self.executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job, fn):
+        if job.stop_event.is_set():
+            job.status = 'cancelled'
+            job.finished_at = time.time()
+            return
+        job.status = 'running'
+        job.started_at = time.time()
+        try:
+            job.result = fn(job)
+            job.status = 'completed'
+        except TrainingCancelled:
+            job.status = 'cancelled'
+            job.message = 'Training was cancelled'
+        except Exception as e:
+            job.status = 'failed'
+            job.message = getattr(e, "message", repr(e))
+        finally:
+            job.final_progress = job.progress()
+            job.trainer = None
+            job.finished_at = time.time()
+            with self.lock:
+                self._prune()
+
+    def _prune(self):
+        """Forgets the oldest finished jobs beyond `max_finished` and those finished more than `finished_ttl` ago."""
+        finished = sorted((job for job in self.jobs.values() if job.done and job.finished_at is not None),
+                          key=lambda job: job.finished_at)
+        expired = len(finished) - self.max_finished
+        now = time.time()
+        for i, job in enumerate(finished):
+            if i < expired or (self.finished_ttl is not None and now - job.finished_at > self.finished_ttl):
+                del self.jobs[job.id]
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        job.stop_event.set()
+        if job.future is not None and job.future.cancel():
+            job.status = 'cancelled'
+            job.finished_at = time.time()
+        return job
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import random
+import threading
+
+# same as torchvision.datasets.folder.IMG_EXTENSIONS
+IMG_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.ppm', '.bmp', '.pgm', '.tif', '.tiff', '.webp')
+
+_LOCK = threading.Lock()
+
+
+class DatasetManifest:
+    """File index of an ImageFolder-style dataset (one subdirectory per class) persisted between runs.
+
+    Every directory is stored with its mtime, its image files (name, size, mtime) and its subdirectories.
+    A refresh only lists directories whose mtime changed, so unchanged trees are not scanned again.
+    """
+
+    def __init__(self, path: str, manifest_path: str):
+        self.path = os.path.abspath(path)
+        self.manifest_path = manifest_path
+        self.dirs = {}
+        self.classes = []
+        self.samples = []
+        self.rescanned_dirs = 0
+        if os.path.isfile(manifest_path):
+            with open(manifest_path) as f:
+                data = json.load(f)
+            if data.get('path') == self.path:
+                self.dirs = data['dirs']
+
+    def _visit(self, rel, old_dirs, new_dirs):
+        abs_dir = os.path.join(self.path, rel)
+        mtime_ns = os.stat(abs_dir).st_mtime_ns
+        entry = old_dirs.get(rel)
+        if entry is None or entry['mtime_ns'] != mtime_ns:
+            files, subdirs = [], []
+            with os.scandir(abs_dir) as it:
+                for e in it:
+                    if e.is_dir():
+                        subdirs.append(e.name)
+                    elif e.name.lower().endswith(IMG_EXTENSIONS) and e.is_file():
+                        st = e.stat()
+                        files.append([e.name, st.st_size, st.st_mtime_ns])
+            entry = {'mtime_ns': mtime_ns, 'files': sorted(files), 'dirs': sorted(subdirs)}
+            self.rescanned_dirs += 1
+        new_dirs[rel] = entry
+        for name in entry['dirs']:
+            self._visit(os.path.join(rel, name), old_dirs, new_dirs)
+
+    def _collect(self, rel, label):
+        entry = self.dirs[rel]
+        for name, _, _ in entry['files']:
+            self.samples.append((os.path.join(self.path, rel, name), label))
+        for name in entry['dirs']:
+            self._collect(os.path.join(rel, name), label)
+
+    def refresh(self):
+        old_dirs, new_dirs = self.dirs, {}
+        self.rescanned_dirs = 0
+        self._visit('', old_dirs, new_dirs)
+        self.dirs = new_dirs
+        self.classes = list(self.dirs['']['dirs'])
+        if not self.classes:
+            raise FileNotFoundError(f"Couldn't find any class folder in {self.path}.")
+        self.samples = []
+        for label, name in enumerate(self.classes):
+            self._collect(name, label)
+        if not self.samples:
+            raise FileNotFoundError(f"Found no valid file for the classes {', '.join(self.classes)}.")
+        if self.rescanned_dirs:
+            self._save()
+        return self
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+        tmp_path = self.manifest_path + f'.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'path': self.path, 'dirs': self.dirs}, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def split(self, valid_part, seed=0):
+        """Stratified split: every class gets a seeded random `valid_part` of its samples for validation.
+
+        Returns sorted (train_indices, valid_indices) into `samples`, so both are grouped by class; the loader
+        shuffles the train split. The same seed and files give the same split.
+        """
+        by_class = {}
+        for idx, (_, label) in enumerate(self.samples):
+            by_class.setdefault(label, []).append(idx)
+        rng = random.Random(seed)
+        train_indices, valid_indices = [], []
+        for label in sorted(by_class):
+            indices = by_class[label]
+            rng.shuffle(indices)
+            n_valid = int(round(valid_part * len(indices)))
+            valid_indices += indices[:n_valid]
+            train_indices += indices[n_valid:]
+        return sorted(train_indices), sorted(valid_indices)
+
+    def get_info(self):
+        return {"path": self.path,
+                "classes": len(self.classes),
+                "samples": len(self.samples),
+                "directories": len(self.dirs),
+                "rescanned_directories": self.rescanned_dirs}
+
+
+def load_manifest(path, root):
+    """Loads the manifest of the dataset at `path` from `root` and brings it up to date with the directory tree."""
+    key = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()
+    with _LOCK:
+        return DatasetManifest(path, os.path.join(root, key + '.json')).refresh()
@@ -1,6 +1,23 @@
+import copy
+import hashlib
+import os
+
 import torch
 from torch import nn
-from torchvision import models
+
+from backbones import SHARED_BACKBONES, SharedHeadModel
+
+
+def _build_uninitialized(backbone_name):
+    """Builds a torchvision model without running its weight init, for weights loaded from a checkpoint anyway."""
+    from torchvision import models
+    try:
+        with torch.device('meta'):
+            model = getattr(models, backbone_name)()
+    except (AttributeError, TypeError):  # torch < 2.0 has no device context
+        return getattr(models, backbone_name)()
+    # torchvision classifiers keep all their buffers in the state dict, so nothing is left uninitialized
+    return model.to_empty(device='cpu')
 
 
 class ModelWrapper:
@@ -8,53 +25,191 @@ class ModelWrapper:
             self,
             backbone_name: str,
             device: str,
+            build_model: bool = True,
     ):
         self.learnable_parameters = None
         self.backbone_name = backbone_name
-        self.model = getattr(models, backbone_name)()
+        self.model = None
+        if build_model:
+            from torchvision import models  # imported on first use to keep server startup fast
+            self.model = getattr(models, backbone_name)()
         self.device = device
+        self.shared_backbone = False
+        self.freeze_backbone = False
         self.trained = False
         self.wandb = None
+        # incremented after every training; part of the prediction cache key
+        self.version = 0
+        # alternative inference modules, e.g. the int8 model, keyed by name
+        self.variants = {}
+        self.variant_info = {}
+        self.default_variant = None
+
+    def copy(self):
+        """Independent copy to train on while this one keeps serving; a shared backbone stays shared."""
+        model_wrapper = ModelWrapper(self.backbone_name, self.device, build_model=False)
+        if self.shared_backbone:
+            model_wrapper.model = SharedHeadModel(self.model.backbone, copy.deepcopy(self.model.fc))
+        else:
+            model_wrapper.model = copy.deepcopy(self.model)
+        model_wrapper.shared_backbone = self.shared_backbone
+        model_wrapper.trained = self.trained
+        model_wrapper.wandb = self.wandb
+        model_wrapper.version = self.version
+        if self.trained:
+            model_wrapper.id2label = self.id2label
+            model_wrapper.freeze_backbone = self.freeze_backbone
+        return model_wrapper
 
     def count_parameters(self):
         return sum(p.numel() for p in self.learnable_parameters if p.requires_grad)
 
     def train(self):
         self.model.train()
+        if self.freeze_backbone and not self.shared_backbone:
+            # a frozen backbone stays in eval mode, so its BatchNorm statistics are the same as for
+            # precomputed embeddings and only the head is trained either way
+            for name, module in self.model.named_children():
+                if name != 'fc':
+                    module.eval()
         self.trained = True
 
     def eval(self):
         self.model.eval()
 
-    def init_model(self, id2label, freeze_backbone):
+    def init_model(self, id2label, freeze_backbone, share_backbone=False):
         self.id2label = id2label
         self.freeze_backbone = freeze_backbone
+        self.default_variant = None
+        self.variants = {}
+        self.variant_info = {}
+        self.shared_backbone = share_backbone and freeze_backbone
 
-        if self.backbone_name == 'resnet18':
-            if self.freeze_backbone:
-                for param in self.model.parameters():
-                    param.requires_grad = False
-            self.model.fc = nn.Linear(self.model.fc.in_features, len(id2label))
-            self.model.to(self.device)
+        if self.shared_backbone:
+            backbone = SHARED_BACKBONES.get(self.backbone_name, self.device)
+            self.model = SharedHeadModel(backbone, nn.Linear(backbone.out_features, len(id2label))).to(self.device)
+        else:
+            if isinstance(self.model, SharedHeadModel):
+                # the pooled backbone must never be unfrozen or trained; continue from a private copy of its weights
+                from torchvision import models
+                backbone = self.model.backbone
+                self.model = getattr(models, self.backbone_name)()
+                self.model.load_state_dict(backbone.state_dict(), strict=False)
+            if self.backbone_name == 'resnet18':
+                if self.freeze_backbone:
+                    for param in self.model.parameters():
+                        param.requires_grad = False
+                self.model.fc = nn.Linear(self.model.fc.in_features, len(id2label))
+                self.model.to(self.device)
 
         self.learnable_parameters = [param for param in self.model.parameters()
                                      if param.requires_grad==True]
 
-    def get_logits(self, x):
-        return self.model(x)
+    def get_logits(self, x, variant=None):
+        if variant is None:
+            return self.model(x)
+        # e.g. quantized variants only run on cpu
+        return self.variants[variant](x.to(self.variant_info[variant].get("device", self.device)))
+
+    def add_variant(self, name, module, info, default=False):
+        self.variants[name] = module
+        self.variant_info[name] = info
+        if default:
+            # predictions switch to the new module with a single attribute assignment
+            self.default_variant = name
+
+    def get_features(self, x):
+        """Input of the `fc` head, whatever the backbone's layout."""
+        if self.shared_backbone:
+            return self.model.backbone(x)
+        # the hook replaces the head's output with its input, so the forward pass returns the features
+        handle = self.model.fc.register_forward_hook(lambda module, inputs, output: inputs[0])
+        try:
+            return self.model(x)
+        finally:
+            handle.remove()
+
+    def get_head_logits(self, features):
+        return self.model.fc(features)
+
+    def predict_features(self, features):
+        preds = self.get_head_logits(features).argmax(1).cpu()
+        return [self.id2label[idx] for idx in preds.tolist()]
+
+    def backbone_fingerprint(self):
+        h = hashlib.sha1(self.backbone_name.encode())
+        for name, tensor in self.model.state_dict().items():
+            if not name.startswith('fc.'):
+                h.update(name.encode())
+                h.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+        return h.hexdigest()
 
     def get_info(self):
         info = { "backbone_name": self.backbone_name,
                  "device": self.device,
-                 "trained": self.trained}
+                 "trained": self.trained,
+                 "version": self.version}
         if self.trained:
             info.update({"num_classes": len(self.id2label),
                          "classes": self.id2label,
-                         "backbone_freezed": self.freeze_backbone})
+                         "backbone_freezed": self.freeze_backbone,
+                         "backbone_shared": self.shared_backbone,
+                         "variants": self.variant_info})
         return info
 
-    def predict(self, src):
-        logits = self.get_logits(src)
+    def memory_bytes(self):
+        # a shared backbone is accounted for once in the backbone pool
+        module = self.model.fc if self.shared_backbone else self.model
+        tensors = list(module.parameters()) + list(module.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors) + \
+            sum(info.get("size_bytes", 0) for info in self.variant_info.values())
+
+    def save(self, path):
+        checkpoint = {"backbone_name": self.backbone_name,
+                      "device": self.device,
+                      "trained": self.trained,
+                      "version": self.version,
+                      "wandb": self.wandb,
+                      "shared_backbone": self.shared_backbone,
+                      "state_dict": self.model.head_state_dict() if self.shared_backbone else self.model.state_dict()}
+        if self.trained:
+            checkpoint.update({"id2label": self.id2label,
+                               "freeze_backbone": self.freeze_backbone})
+        tmp_path = path + '.tmp'
+        torch.save(checkpoint, tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        try:
+            checkpoint = torch.load(path, map_location='cpu', mmap=True)
+        except TypeError:  # torch < 2.1 can not memory-map checkpoints
+            checkpoint = torch.load(path, map_location='cpu')
+        shared_backbone = checkpoint.get("shared_backbone", False)
+        model_wrapper = cls(checkpoint["backbone_name"], checkpoint["device"], build_model=False)
+        if not shared_backbone:
+            model_wrapper.model = _build_uninitialized(checkpoint["backbone_name"])
+        if checkpoint["trained"]:
+            model_wrapper.init_model(checkpoint["id2label"], checkpoint["freeze_backbone"], shared_backbone)
+        # the checkpoint of a model with a shared backbone only holds its head
+        strict = not shared_backbone
+        try:
+            model_wrapper.model.load_state_dict(checkpoint["state_dict"], strict=strict, assign=True)
+        except TypeError:
+            model_wrapper.model.load_state_dict(checkpoint["state_dict"], strict=strict)
+        model_wrapper.model.to(model_wrapper.device)
+        model_wrapper.trained = checkpoint["trained"]
+        model_wrapper.wandb = checkpoint["wandb"]
+        model_wrapper.version = checkpoint.get("version", 0)
+        model_wrapper.eval()
+        return model_wrapper
+
+    def predict(self, src, variant=None, top_k=None):
+        logits = self.get_logits(src, variant if variant is not None else self.default_variant)
+        if top_k is not None:
+            probs, indices = torch.softmax(logits.float(), 1).topk(min(top_k, len(self.id2label)), 1)
+            return [{"labels": [self.id2label[idx] for idx in row], "probs": p}
+                    for row, p in zip(indices.cpu().tolist(), probs.cpu().tolist())]
         _, preds = torch.max(logits, 1)
         preds = preds.reshape(-1, 1).detach().cpu()
         labels = [self.id2label[idx.item()] for idx in preds]
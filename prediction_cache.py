@@ -0,0 +1,65 @@
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+
+
+def content_digest(data: bytes):
+    return hashlib.sha1(data).hexdigest()
+
+
+def prediction_key(model_name, version, variant, data: bytes):
+    # a new version or another variant may predict differently for the same bytes
+    return model_name, version, variant, content_digest(data)
+
+
+class PredictionCache:
+    """LRU cache of predictions keyed by model name, model version, variant and a hash of the input bytes."""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _entry_size(key, value):
+        return sum(sys.getsizeof(part) for part in key) + sys.getsizeof(value)
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self.lock:
+            if key in self.entries:
+                self.nbytes -= self._entry_size(key, self.entries.pop(key))
+            self.entries[key] = value
+            self.nbytes += self._entry_size(key, value)
+            while self.entries and (len(self.entries) > self.max_entries or self.nbytes > self.max_bytes):
+                old_key, old_value = self.entries.popitem(last=False)
+                self.nbytes -= self._entry_size(old_key, old_value)
+
+    def invalidate(self, model_name):
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == model_name]:
+                self.nbytes -= self._entry_size(key, self.entries.pop(key))
+
+    def get_stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {"entries": len(self.entries),
+                    "bytes": self.nbytes,
+                    "max_entries": self.max_entries,
+                    "max_bytes": self.max_bytes,
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "hit_rate": self.hits / total if total else 0.}
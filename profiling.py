@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+import uuid
+
+import torch
+from torch.profiler import ProfilerActivity, profile
+
+import config
+
+
+class ProfileSession:
+    def __init__(self, model_name: str, target: str, steps: int, output_dir: str):
+        self.id = uuid.uuid4().hex
+        self.model_name = model_name
+        self.target = target
+        self.steps = steps
+        self.output_dir = output_dir
+        self.status = 'armed'
+        self.message = None
+        self.steps_done = 0
+        self.trace_path = None
+        self.table = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.profiler = None
+
+    def start(self):
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+        self.profiler = profile(activities=activities, record_shapes=True, profile_memory=True)
+        self.profiler.__enter__()
+        self.status = 'running'
+
+    def step(self):
+        """Marks one profiled step as done; returns True once the session has finished."""
+        self.steps_done += 1
+        if self.steps_done >= self.steps:
+            self.stop()
+            return True
+        return False
+
+    def stop(self):
+        if self.profiler is None:
+            return
+        profiler, self.profiler = self.profiler, None
+        try:
+            profiler.__exit__(None, None, None)
+            os.makedirs(self.output_dir, exist_ok=True)
+            self.trace_path = os.path.join(self.output_dir, f"{self.id}.json")
+            profiler.export_chrome_trace(self.trace_path)
+            self.table = profiler.key_averages(group_by_input_shape=True).table(
+                sort_by="self_cpu_time_total", row_limit=50)
+            self.status = 'done'
+        except Exception as e:
+            self.status = 'failed'
+            self.message = getattr(e, "message", repr(e))
+        self.finished_at = time.time()
+
+    def get_info(self):
+        return {"profile_id": self.id,
+                "model_name": self.model_name,
+                "target": self.target,
+                "steps": self.steps,
+                "steps_done": self.steps_done,
+                "status": self.status,
+                "message": self.message,
+                "created_at": self.created_at,
+                "finished_at": self.finished_at}
+
+
+class Profiler:
+    """Profiling requests waiting for the next training steps or predict calls of a model.
+
+    Training and prediction only check `pending` for truthiness, so nothing is paid while it is empty.
+    """
+
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self.pending = {}
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def arm(self, model_name, target, steps):
+        session = ProfileSession(model_name, target, steps, self.output_dir)
+        with self.lock:
+            if (model_name, target) in self.pending:
+                return None
+            self.pending[(model_name, target)] = session
+            self.sessions[session.id] = session
+        return session
+
+    def take(self, model_name, target):
+        with self.lock:
+            session = self.pending.pop((model_name, target), None)
+        if session is not None:
+            session.start()
+        return session
+
+    def get(self, profile_id):
+        return self.sessions.get(profile_id)
+
+
+PROFILER = Profiler(config.PROFILE_DIR)
@@ -0,0 +1,85 @@
+import copy
+import io
+import time
+
+import torch
+
+from model_wrapper import ModelWrapper
+
+QUANTIZATION_BACKENDS = ('fbgemm', 'x86')
+
+
+def serialized_size(module):
+    buffer = io.BytesIO()
+    torch.save(module.state_dict(), buffer)
+    return buffer.tell()
+
+
+@torch.no_grad()
+def measure_latency(module, x, repeats=10):
+    module(x)  # warm-up
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        module(x)
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2]
+
+
+@torch.no_grad()
+def accuracy(module, dataloader):
+    corrects, n = 0, 0
+    for inputs, labels in dataloader:
+        corrects += (module(inputs).argmax(1) == labels).sum().item()
+        n += labels.numel()
+    return corrects / n if n else 0.
+
+
+def quantize_static(
+        model_wrapper: ModelWrapper,
+        calibration_loader,
+        backend: str = 'x86',
+        num_calibration_batches: int = 10):
+    """Builds a static int8 copy of the model with FX graph mode quantization and compares it to fp32.
+
+    The fp32 and int8 models are both evaluated on cpu on `calibration_loader`, which is also used
+    for calibrating the observers.
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    if backend not in QUANTIZATION_BACKENDS:
+        raise ValueError(f"Unknown quantization backend {backend}; expected one of {QUANTIZATION_BACKENDS}")
+    torch.backends.quantized.engine = backend
+
+    fp32_model = copy.deepcopy(model_wrapper.model).cpu().eval()
+    example_inputs, _ = next(iter(calibration_loader))
+    prepared = prepare_fx(copy.deepcopy(fp32_model), get_default_qconfig_mapping(backend),
+                          example_inputs=(example_inputs,))
+    with torch.no_grad():
+        for i, (inputs, _) in enumerate(calibration_loader):
+            if i >= num_calibration_batches:
+                break
+            prepared(inputs)
+    int8_model = convert_fx(prepared)
+
+    fp32_accuracy = accuracy(fp32_model, calibration_loader)
+    int8_accuracy = accuracy(int8_model, calibration_loader)
+    fp32_latency = measure_latency(fp32_model, example_inputs)
+    int8_latency = measure_latency(int8_model, example_inputs)
+    fp32_size = serialized_size(fp32_model)
+    int8_size = serialized_size(int8_model)
+    info = {"backend": backend,
+            "device": "cpu",
+            "calibration_batches": min(num_calibration_batches, len(calibration_loader)),
+            "accuracy_fp32": fp32_accuracy,
+            "accuracy_int8": int8_accuracy,
+            "accuracy_change": int8_accuracy - fp32_accuracy,
+            "batch_size": example_inputs.size(0),
+            "latency_ms_fp32": fp32_latency * 1000.,
+            "latency_ms_int8": int8_latency * 1000.,
+            "speedup": fp32_latency / int8_latency if int8_latency > 0 else None,
+            "size_bytes_fp32": fp32_size,
+            "size_bytes": int8_size,
+            "size_reduction": 1. - int8_size / fp32_size}
+    return int8_model, info
@@ -0,0 +1,251 @@
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import torch
+
+from model_wrapper import ModelWrapper
+
+
+class ModelRegistry:
+    """Dict-like store of models persisted on disk; loaded models are kept under a memory budget."""
+
+    def __init__(self, root: str, budget_bytes: int):
+        self.root = root
+        self.budget_bytes = budget_bytes
+        self.resident = OrderedDict()
+        # one future per model being loaded from disk; concurrent requests for it wait on the same load
+        self.loading = {}
+        self.lock = threading.RLock()
+        os.makedirs(root, exist_ok=True)
+        self.index_path = os.path.join(root, 'index.json')
+        if os.path.isfile(self.index_path):
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+        else:
+            self.index = {}
+
+    def _path(self, name):
+        return os.path.join(self.root, f"{name}.pt")
+
+    def _version_path(self, name, version):
+        return os.path.join(self.root, 'versions', name, f"{version}.pt")
+
+    def _variant_path(self, name, version, variant):
+        return os.path.join(self.root, 'versions', name, f"{version}.{variant}.pt")
+
+    def _load_variants(self, name, model_wrapper):
+        """Attaches the stored variants of the loaded version, e.g. its int8 or compiled module."""
+        versions_dir = os.path.dirname(self._version_path(name, 0))
+        prefix = f"{model_wrapper.version}."
+        if not os.path.isdir(versions_dir):
+            return
+        for file in sorted(os.listdir(versions_dir)):
+            if not (file.startswith(prefix) and file.endswith('.json')):
+                continue
+            variant = file[len(prefix):-len('.json')]
+            try:
+                with open(os.path.join(versions_dir, file)) as f:
+                    meta = json.load(f)
+                module = torch.jit.load(self._variant_path(name, model_wrapper.version, variant),
+                                        map_location=meta["info"].get("device", model_wrapper.device))
+            except (OSError, ValueError, RuntimeError) as e:
+                print(f"Variant {variant} of {name} could not be loaded: {e!r}")
+                continue
+            model_wrapper.add_variant(variant, module, meta["info"], meta["default"])
+
+    def _write_index(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _evict(self):
+        used = sum(model_wrapper.memory_bytes() for model_wrapper in self.resident.values())
+        # every model and its variants are persisted when they are added, so evicting only drops the reference
+        while used > self.budget_bytes and len(self.resident) > 1:
+            _, model_wrapper = self.resident.popitem(last=False)
+            used -= model_wrapper.memory_bytes()
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def keys(self):
+        return list(self.index.keys())
+
+    def __getitem__(self, name):
+        with self.lock:
+            if name in self.resident:
+                self.resident.move_to_end(name)
+                return self.resident[name]
+            if name not in self.index:
+                raise KeyError(name)
+            future = self.loading.get(name)
+            if future is None:
+                future = self.loading[name] = Future()
+                loader = True
+            else:
+                loader = False
+        if not loader:
+            return future.result()
+
+        # loaded outside the lock, so requests for resident models are not held up by the disk
+        try:
+            model_wrapper = ModelWrapper.load(self._path(name))
+            self._load_variants(name, model_wrapper)
+            with self.lock:
+                if name not in self.index:
+                    raise KeyError(name)
+                if name in self.resident:
+                    # saved, published or rolled back meanwhile; the newer wrapper wins
+                    model_wrapper = self.resident[name]
+                else:
+                    self.resident[name] = model_wrapper
+                    self._evict()
+        except BaseException as e:
+            with self.lock:
+                self.loading.pop(name, None)
+            future.set_exception(e)
+            raise
+        with self.lock:
+            self.loading.pop(name, None)
+        future.set_result(model_wrapper)
+        return model_wrapper
+
+    def __setitem__(self, name, model_wrapper):
+        self.save(name, model_wrapper)
+
+    def save(self, name, model_wrapper=None):
+        if not name or os.path.basename(name) != name:
+            raise ValueError(f"Invalid model name {name!r}")
+        with self.lock:
+            if model_wrapper is None:
+                model_wrapper = self.resident[name]
+            model_wrapper.save(self._path(name))
+            self.index[name] = model_wrapper.get_info()
+            self._write_index()
+            self.resident[name] = model_wrapper
+            self.resident.move_to_end(name)
+            self._evict()
+
+    def pop(self, name):
+        with self.lock:
+            self.index.pop(name)
+            self._write_index()
+            model_wrapper = self.resident.pop(name, None)
+            if os.path.isfile(self._path(name)):
+                os.remove(self._path(name))
+            shutil.rmtree(os.path.dirname(self._version_path(name, 0)), ignore_errors=True)
+            return model_wrapper
+
+    def versions(self, name):
+        """Published versions of a model, oldest first."""
+        versions_dir = os.path.dirname(self._version_path(name, 0))
+        if not os.path.isdir(versions_dir):
+            return []
+        versions = []
+        for file in os.listdir(versions_dir):
+            version, ext = os.path.splitext(file)
+            if ext == '.pt' and version.isdigit():
+                st = os.stat(os.path.join(versions_dir, file))
+                versions.append({"version": int(version), "created_at": st.st_mtime, "size_bytes": st.st_size})
+        return sorted(versions, key=lambda v: v["version"])
+
+    def _activate(self, name, model_wrapper, version_path):
+        # the current checkpoint is a hard link to the immutable version file and is swapped atomically
+        tmp_path = self._path(name) + '.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        try:
+            os.link(version_path, tmp_path)
+        except OSError:
+            shutil.copyfile(version_path, tmp_path)
+        os.replace(tmp_path, self._path(name))
+        self.index[name] = model_wrapper.get_info()
+        self._write_index()
+        # requests that already hold the previous wrapper finish on it
+        self.resident[name] = model_wrapper
+        self.resident.move_to_end(name)
+        self._evict()
+
+    def publish(self, name, model_wrapper):
+        """Stores a trained copy of a model as a new immutable version and makes it the current one."""
+        with self.lock:
+            if name not in self.index:
+                raise KeyError(name)
+            version = max([v["version"] for v in self.versions(name)] + [self.index[name].get("version", 0)]) + 1
+        model_wrapper.version = version
+        version_path = self._version_path(name, version)
+        os.makedirs(os.path.dirname(version_path), exist_ok=True)
+        model_wrapper.save(version_path)
+        with self.lock:
+            if name not in self.index:
+                raise KeyError(name)
+            self._activate(name, model_wrapper, version_path)
+        return version
+
+    def rollback(self, name, version):
+        """Makes an earlier published version the current one again; it keeps its version number."""
+        version_path = self._version_path(name, version)
+        if name not in self.index or not os.path.isfile(version_path):
+            raise KeyError(version)
+        model_wrapper = ModelWrapper.load(version_path)
+        self._load_variants(name, model_wrapper)
+        with self.lock:
+            if name not in self.index:
+                raise KeyError(name)
+            self._activate(name, model_wrapper, version_path)
+        return model_wrapper
+
+    def add_variant(self, name, model_wrapper, variant, module, info, default=False):
+        """Attaches an inference variant and stores it next to the model's version, so it is loaded with it again.
+
+        Returns whether `model_wrapper` still is the current version of the model.
+        """
+        path = self._variant_path(name, model_wrapper.version, variant)
+        try:
+            scripted = module if isinstance(module, torch.jit.ScriptModule) else torch.jit.script(module)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            torch.jit.save(scripted, path + '.tmp')
+            os.replace(path + '.tmp', path)
+            meta_path = os.path.splitext(path)[0] + '.json'
+            with open(meta_path + '.tmp', 'w') as f:
+                json.dump({"info": info, "default": default}, f, default=str)
+            os.replace(meta_path + '.tmp', meta_path)
+            info = dict(info, persisted=True)
+        except Exception as e:  # e.g. torch.compile modules can not be serialized; they only live in memory
+            info = dict(info, persisted=False, persist_error=repr(e))
+        with self.lock:
+            model_wrapper.add_variant(variant, module, info, default)
+            current = name in self.index and self.index[name].get("version") == model_wrapper.version
+            if self.resident.get(name) is model_wrapper:
+                self.index[name] = model_wrapper.get_info()
+                self._write_index()
+                # the variant adds to the memory of the model
+                self._evict()
+        return current
+
+    def get_info(self, name):
+        with self.lock:
+            model_wrapper = self.resident.get(name)
+            return {"info": model_wrapper.get_info() if model_wrapper is not None else self.index[name],
+                    "versions": self.versions(name),
+                    "resident": model_wrapper is not None,
+                    "memory_bytes": model_wrapper.memory_bytes() if model_wrapper is not None else 0}
+
+    def resident_memory(self):
+        with self.lock:
+            return {name: model_wrapper.memory_bytes() for name, model_wrapper in self.resident.items()}
+
+    def get_stats(self):
+        with self.lock:
+            return {"budget_bytes": self.budget_bytes,
+                    "resident_bytes": sum(m.memory_bytes() for m in self.resident.values()),
+                    "resident_models": len(self.resident),
+                    "models": len(self.index)}
@@ -0,0 +1,147 @@
+import bisect
+import os
+import threading
+from collections import defaultdict
+
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10., 30., 60.)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            lines += self._samples()
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.values = defaultdict(float)
+
+    def inc(self, amount=1., **labels):
+        with self.lock:
+            self.values[self._key(labels)] += amount
+
+    def _samples(self):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in self.values.items()]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def dec(self, amount=1., **labels):
+        self.inc(-amount, **labels)
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self.counts = {}
+        self.sums = defaultdict(float)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            if key not in self.counts:
+                self.counts[key] = [0] * (len(self.buckets) + 1)
+            self.counts[key][bisect.bisect_left(self.buckets, value)] += 1
+            self.sums[key] += value
+
+    def _samples(self):
+        lines = []
+        for key, counts in self.counts.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {self.sums[key]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    'http_request_duration_seconds', 'Request latency per resource', ('endpoint', 'method', 'status')))
+REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    'http_requests_in_flight', 'Requests currently being served per resource', ('endpoint',)))
+TRAIN_STAGE_SECONDS = REGISTRY.register(Counter(
+    'train_stage_seconds_total', 'Training time per stage: data_wait, forward, backward, optimizer',
+    ('model', 'stage')))
+TRAIN_IMAGES = REGISTRY.register(Counter(
+    'train_images_total', 'Images processed by training per phase', ('model', 'phase')))
+TRAIN_IMAGES_PER_SECOND = REGISTRY.register(Gauge(
+    'train_images_per_second', 'Throughput of the last training epoch per phase', ('model', 'phase')))
+PREDICT_IMAGES = REGISTRY.register(Counter(
+    'predict_images_total', 'Images predicted per model', ('model',)))
+PREDICT_SECONDS = REGISTRY.register(Counter(
+    'predict_compute_seconds_total', 'Time spent in model forward passes for predictions', ('model',)))
+PREDICT_IMAGES_PER_SECOND = REGISTRY.register(Gauge(
+    'predict_images_per_second', 'Throughput of the last prediction batch', ('model',)))
+MODEL_MEMORY_BYTES = REGISTRY.register(Gauge(
+    'model_resident_memory_bytes', 'Memory of the models loaded in the registry', ('model',)))
+PROCESS_MEMORY_BYTES = REGISTRY.register(Gauge(
+    'process_resident_memory_bytes', 'Resident set size of the server process'))
+TRACKING_DROPPED_EVENTS = REGISTRY.register(Counter(
+    'tracking_dropped_events_total', 'Experiment tracking events lost because SQLite failed to write them'))
+
+
+def process_rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return psutil.Process().memory_info().rss
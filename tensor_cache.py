@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+import torch
+
+
+def dataset_fingerprint(path, samples, transform_repr):
+    h = hashlib.sha1()
+    h.update(os.path.abspath(path).encode())
+    h.update(transform_repr.encode())
+    for file, label in samples:
+        st = os.stat(file)
+        h.update(f"{file}\0{label}\0{st.st_mtime_ns}\0{st.st_size}\n".encode())
+    return h.hexdigest()
+
+
+class TensorCache:
+    """On-disk store of resized uint8 image tensors kept under a size budget with LRU eviction."""
+
+    def __init__(self, root: str, budget_bytes: int):
+        self.root = root
+        self.budget_bytes = budget_bytes
+        self.lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _entries(self):
+        entries = []
+        for key in os.listdir(self.root):
+            meta_path = os.path.join(self.root, key, 'meta.json')
+            if os.path.isfile(meta_path):
+                with open(meta_path) as f:
+                    meta = json.load(f)
+                entries.append((os.path.getmtime(meta_path), key, meta['nbytes']))
+        return entries
+
+    def _evict(self, needed):
+        entries = sorted(self._entries())
+        used = sum(nbytes for _, _, nbytes in entries)
+        for _, key, nbytes in entries:
+            if used + needed <= self.budget_bytes:
+                break
+            shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+            used -= nbytes
+        return used + needed <= self.budget_bytes
+
+    def open(self, key, num_items, size):
+        """Returns the entry directory for `key`, creating it if needed, or None if it does not fit the budget."""
+        entry_dir = os.path.join(self.root, key)
+        meta_path = os.path.join(entry_dir, 'meta.json')
+        shape = (num_items, 3, size[0], size[1])
+        nbytes = int(np.prod(shape)) + num_items
+        with self.lock:
+            if not os.path.isfile(meta_path):
+                if not self._evict(nbytes):
+                    return None
+                os.makedirs(entry_dir, exist_ok=True)
+                np.lib.format.open_memmap(os.path.join(entry_dir, 'data.npy'), mode='w+', dtype=np.uint8, shape=shape)
+                np.lib.format.open_memmap(os.path.join(entry_dir, 'filled.npy'), mode='w+', dtype=np.uint8,
+                                          shape=(num_items,))
+                with open(meta_path, 'w') as f:
+                    json.dump({'shape': shape, 'nbytes': nbytes}, f)
+            os.utime(meta_path, (time.time(), time.time()))
+        return entry_dir
+
+    def get_info(self):
+        entries = self._entries()
+        return {"root": self.root,
+                "budget_bytes": self.budget_bytes,
+                "used_bytes": sum(nbytes for _, _, nbytes in entries),
+                "entries": len(entries)}
+
+
+class CachedImageDataset(torch.utils.data.Dataset):
+    """Decodes each sample once and serves later reads from the memory-mapped cache entry."""
+
+    def __init__(self, samples, entry_dir, loader):
+        self.samples = samples
+        self.targets = [label for _, label in samples]
+        self.entry_dir = entry_dir
+        self.loader = loader
+        self._data = None
+        self._filled = None
+
+    def _open(self):
+        # opened lazily so that every DataLoader worker maps the files itself instead of pickling them
+        self._data = np.load(os.path.join(self.entry_dir, 'data.npy'), mmap_mode='r+')
+        self._filled = np.load(os.path.join(self.entry_dir, 'filled.npy'), mmap_mode='r+')
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, idx):
+        if self._data is None:
+            self._open()
+        file, label = self.samples[idx]
+        if self._filled[idx]:
+            x = torch.from_numpy(np.array(self._data[idx]))
+        else:
+            x = self.loader(file)
+            self._data[idx] = x.numpy()
+            self._filled[idx] = 1
+        return x.float().div_(255), label
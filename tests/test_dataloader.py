@@ -0,0 +1,51 @@
+import importlib.util
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+HAS_TORCH = all(importlib.util.find_spec(m) for m in ('torch', 'numpy'))
+
+
+@unittest.skipUnless(HAS_TORCH, "torch and numpy are not installed")
+class TensorFromBufferTest(unittest.TestCase):
+    def setUp(self):
+        from dataloader import IMAGE_SIZE
+        self.shape = (3,) + tuple(IMAGE_SIZE)
+        self.size = 3 * IMAGE_SIZE[0] * IMAGE_SIZE[1]
+
+    def test_single_uint8_image(self):
+        import torch
+        from dataloader import tensor_from_buffer
+        tensor = tensor_from_buffer(bytes(range(256)) * (self.size // 256) + bytes(self.size % 256), self.shape)
+        self.assertEqual(tensor.dtype, torch.uint8)
+        self.assertEqual(tuple(tensor.shape), (1,) + self.shape)
+        self.assertEqual(tensor.flatten()[:3].tolist(), [0, 1, 2])
+
+    def test_float32_batch_with_offset(self):
+        import numpy as np
+        import torch
+        from dataloader import tensor_from_buffer
+        data = b'head' + np.full((2,) + self.shape, 0.5, dtype='<f4').tobytes()
+        tensor = tensor_from_buffer(data, (2,) + self.shape, dtype='float32', offset=4)
+        self.assertEqual(tensor.dtype, torch.float32)
+        self.assertEqual(tuple(tensor.shape), (2,) + self.shape)
+        self.assertTrue(bool((tensor == 0.5).all()))
+
+    def test_invalid_payloads_are_rejected(self):
+        from dataloader import tensor_from_buffer
+        with self.assertRaisesRegex(ValueError, "dtype"):
+            tensor_from_buffer(bytes(self.size * 8), self.shape, dtype='float64')
+        with self.assertRaisesRegex(ValueError, "shape"):
+            tensor_from_buffer(bytes(self.size), (self.size,))
+        with self.assertRaisesRegex(ValueError, "shape"):
+            tensor_from_buffer(bytes(self.size), (1,) + self.shape[::-1])
+        with self.assertRaisesRegex(ValueError, "Payload"):
+            tensor_from_buffer(bytes(self.size - 1), self.shape)
+        with self.assertRaisesRegex(ValueError, "Payload"):
+            tensor_from_buffer(bytes(self.size), (2,) + self.shape)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import importlib.util
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+HAS_TORCH = importlib.util.find_spec('torch') is not None
+
+
+@unittest.skipUnless(HAS_TORCH, "torch is not installed")
+class JobSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        from jobs import JobScheduler
+        self.scheduler = JobScheduler(max_workers=1, max_queued=2, max_finished=2)
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        self.scheduler.executor.shutdown(wait=True)
+
+    def blocking(self, job):
+        from trainer import TrainingCancelled
+        self.started.set()
+        self.release.wait(10)
+        if job.stop_event.is_set():
+            raise TrainingCancelled()
+        return {"best_score": 1.}
+
+    def test_completed_job(self):
+        self.release.set()
+        job = self.scheduler.submit('my_model', {'epochs_numb': 3}, self.blocking)
+        job.future.result(10)
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(job.result, {"best_score": 1.})
+        self.assertEqual(job.get_info()["progress"], {'epoch': 0, 'epochs_numb': 3, 'metrics': {}})
+        self.assertIsNone(self.scheduler.active_job('my_model'))
+
+    def test_failed_job_keeps_the_message(self):
+        def fail(job):
+            raise ValueError("broken dataset")
+
+        job = self.scheduler.submit('my_model', {}, fail)
+        job.future.result(10)
+        self.assertEqual(job.status, 'failed')
+        self.assertIn("broken dataset", job.message)
+
+    def test_cancel_running_and_queued_jobs(self):
+        running = self.scheduler.submit('my_model', {}, self.blocking)
+        self.assertTrue(self.started.wait(10))
+        queued = self.scheduler.submit('other_model', {}, self.blocking)
+        self.assertIs(self.scheduler.active_job('my_model'), running)
+        self.assertEqual(running.status, 'running')
+
+        self.scheduler.cancel(queued.id)
+        self.assertEqual(queued.status, 'cancelled')
+        self.scheduler.cancel(running.id)
+        self.release.set()
+        running.future.result(10)
+        self.assertEqual(running.status, 'cancelled')
+        self.assertIsNone(self.scheduler.cancel('unknown'))
+
+    def test_queue_limit(self):
+        self.scheduler.submit('a', {}, self.blocking)
+        self.scheduler.submit('b', {}, self.blocking)
+        self.assertIsNone(self.scheduler.submit('c', {}, self.blocking))
+
+    def test_finished_jobs_are_pruned_and_release_the_trainer(self):
+        def train(job):
+            job.trainer = object()
+            return {}
+
+        jobs = [self.scheduler.submit('my_model', {}, train) for _ in range(3)]
+        for job in jobs:
+            job.future.result(10)
+            self.assertIsNone(job.trainer)
+        self.assertIsNone(self.scheduler.get(jobs[0].id))
+        self.assertIs(self.scheduler.get(jobs[2].id), jobs[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
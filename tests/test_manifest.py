@@ -0,0 +1,48 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from manifest import load_manifest
+
+
+class ManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dataset_path = os.path.join(self.tmp_dir.name, 'dataset')
+        self.manifest_dir = os.path.join(self.tmp_dir.name, 'manifests')
+        for label, count in (('cats', 10), ('dogs', 20)):
+            os.makedirs(os.path.join(self.dataset_path, label))
+            for i in range(count):
+                with open(os.path.join(self.dataset_path, label, f'{i}.png'), 'wb') as f:
+                    f.write(b'png')
+        with open(os.path.join(self.dataset_path, 'dogs', 'notes.txt'), 'w') as f:
+            f.write('not an image')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_samples_and_classes(self):
+        manifest = load_manifest(self.dataset_path, self.manifest_dir)
+        self.assertEqual(manifest.classes, ['cats', 'dogs'])
+        self.assertEqual(len(manifest.samples), 30)
+        self.assertEqual(sum(label for _, label in manifest.samples), 20)
+
+    def test_unchanged_tree_is_not_scanned_again(self):
+        self.assertEqual(load_manifest(self.dataset_path, self.manifest_dir).rescanned_dirs, 3)
+        self.assertEqual(load_manifest(self.dataset_path, self.manifest_dir).rescanned_dirs, 0)
+
+    def test_split_is_stratified_and_deterministic(self):
+        manifest = load_manifest(self.dataset_path, self.manifest_dir)
+        train_indices, valid_indices = manifest.split(0.2, seed=7)
+        self.assertEqual((train_indices, valid_indices), manifest.split(0.2, seed=7))
+        self.assertEqual(sorted(train_indices + valid_indices), list(range(30)))
+        valid_labels = [manifest.samples[i][1] for i in valid_indices]
+        self.assertEqual((valid_labels.count(0), valid_labels.count(1)), (2, 4))
+        self.assertNotEqual(valid_indices, manifest.split(0.2, seed=8)[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
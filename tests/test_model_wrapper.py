@@ -0,0 +1,97 @@
+import importlib.util
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+HAS_TORCH = all(importlib.util.find_spec(m) for m in ('torch', 'torchvision'))
+
+
+@unittest.skipUnless(HAS_TORCH, "torch and torchvision are not installed")
+class SharedBackboneTransitionTest(unittest.TestCase):
+    def setUp(self):
+        import backbones
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.pool = backbones.SHARED_BACKBONES
+        self.saved_root, self.saved_backbones = self.pool.root, self.pool.backbones
+        self.pool.root, self.pool.backbones = self.tmp_dir.name, {}
+
+    def tearDown(self):
+        self.pool.root, self.pool.backbones = self.saved_root, self.saved_backbones
+        self.tmp_dir.cleanup()
+
+    def test_unsharing_builds_a_private_trainable_backbone(self):
+        import torch
+        from backbones import SharedHeadModel
+        from model_wrapper import ModelWrapper
+
+        shared = ModelWrapper('resnet18', 'cpu')
+        shared.init_model(['a', 'b'], freeze_backbone=True, share_backbone=True)
+        self.assertTrue(shared.shared_backbone)
+        pooled = shared.model.backbone
+
+        model_wrapper = shared.copy()
+        model_wrapper.init_model(['a', 'b'], freeze_backbone=False, share_backbone=False)
+        self.assertFalse(model_wrapper.shared_backbone)
+        self.assertNotIsInstance(model_wrapper.model, SharedHeadModel)
+        self.assertTrue(model_wrapper.model.conv1.weight.requires_grad)
+        self.assertTrue(torch.equal(model_wrapper.model.conv1.weight, pooled.conv1.weight))
+        # the pooled backbone stays frozen and is not the private copy
+        self.assertIsNot(model_wrapper.model.conv1.weight, pooled.conv1.weight)
+        self.assertFalse(any(param.requires_grad for param in pooled.parameters()))
+
+        model_wrapper.trained = True
+        path = os.path.join(self.tmp_dir.name, 'model.pt')
+        model_wrapper.save(path)
+        loaded = ModelWrapper.load(path)
+        self.assertFalse(loaded.shared_backbone)
+        self.assertEqual(len(loaded.predict(torch.rand(2, 3, 224, 224))), 2)
+
+    def test_shared_checkpoint_only_holds_the_head(self):
+        import torch
+        from model_wrapper import ModelWrapper
+
+        model_wrapper = ModelWrapper('resnet18', 'cpu')
+        model_wrapper.init_model(['a', 'b', 'c'], freeze_backbone=True, share_backbone=True)
+        model_wrapper.trained = True
+        path = os.path.join(self.tmp_dir.name, 'model.pt')
+        model_wrapper.save(path)
+        self.assertEqual(set(torch.load(path)["state_dict"]), {'fc.weight', 'fc.bias'})
+        loaded = ModelWrapper.load(path)
+        self.assertIs(loaded.model.backbone, model_wrapper.model.backbone)
+
+
+
+@unittest.skipUnless(HAS_TORCH, "torch and torchvision are not installed")
+class FeaturesTest(unittest.TestCase):
+    def test_features_are_the_input_of_the_head(self):
+        import torch
+        from model_wrapper import ModelWrapper
+
+        model_wrapper = ModelWrapper('resnet18', 'cpu')
+        model_wrapper.init_model(['a', 'b', 'c'], freeze_backbone=True)
+        model_wrapper.eval()
+        with torch.inference_mode():
+            x = torch.rand(2, 3, 64, 64)
+            features = model_wrapper.get_features(x)
+            self.assertEqual(tuple(features.shape), (2, model_wrapper.model.fc.in_features))
+            self.assertTrue(torch.allclose(model_wrapper.get_head_logits(features), model_wrapper.get_logits(x)))
+
+    def test_frozen_backbone_keeps_batch_norm_statistics(self):
+        import torch
+        from model_wrapper import ModelWrapper
+
+        model_wrapper = ModelWrapper('resnet18', 'cpu')
+        model_wrapper.init_model(['a', 'b'], freeze_backbone=True)
+        model_wrapper.train()
+        self.assertFalse(model_wrapper.model.bn1.training)
+        self.assertTrue(model_wrapper.model.fc.training)
+        running_mean = model_wrapper.model.bn1.running_mean.clone()
+        model_wrapper.get_logits(torch.rand(2, 3, 64, 64))
+        self.assertTrue(torch.equal(model_wrapper.model.bn1.running_mean, running_mean))
+
+
+if __name__ == '__main__':
+    unittest.main()
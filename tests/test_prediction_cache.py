@@ -0,0 +1,55 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prediction_cache import PredictionCache, prediction_key
+
+
+class PredictionKeyTest(unittest.TestCase):
+    def test_key_depends_on_model_version_variant_and_content(self):
+        key = prediction_key('my_model', 1, None, b'image')
+        self.assertEqual(key, prediction_key('my_model', 1, None, b'image'))
+        for other in (prediction_key('other_model', 1, None, b'image'),
+                      prediction_key('my_model', 2, None, b'image'),
+                      prediction_key('my_model', 1, 'int8', b'image'),
+                      prediction_key('my_model', 1, None, b'other image')):
+            self.assertNotEqual(key, other)
+        self.assertEqual(key[0], 'my_model')
+
+
+class PredictionCacheTest(unittest.TestCase):
+    def test_hit_and_miss_counts(self):
+        cache = PredictionCache(max_entries=10, max_bytes=1 << 20)
+        key = prediction_key('my_model', 1, None, b'image')
+        self.assertIsNone(cache.get(key))
+        cache.put(key, 'cat')
+        self.assertEqual(cache.get(key), 'cat')
+        stats = cache.get_stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 1, 1))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = PredictionCache(max_entries=2, max_bytes=1 << 20)
+        keys = [prediction_key('my_model', 1, None, bytes([i])) for i in range(3)]
+        cache.put(keys[0], 'a')
+        cache.put(keys[1], 'b')
+        cache.get(keys[0])
+        cache.put(keys[2], 'c')
+        self.assertEqual(cache.get(keys[0]), 'a')
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertEqual(cache.get(keys[2]), 'c')
+
+    def test_invalidate_only_drops_the_model(self):
+        cache = PredictionCache(max_entries=10, max_bytes=1 << 20)
+        cache.put(prediction_key('my_model', 1, None, b'image'), 'cat')
+        cache.put(prediction_key('other_model', 1, None, b'image'), 'dog')
+        cache.invalidate('my_model')
+        self.assertIsNone(cache.get(prediction_key('my_model', 1, None, b'image')))
+        self.assertEqual(cache.get(prediction_key('other_model', 1, None, b'image')), 'dog')
+        self.assertEqual(cache.get_stats()["bytes"], cache._entry_size(prediction_key('other_model', 1, None, b'image'),
+                                                                       'dog'))
+
+
+if __name__ == '__main__':
+    unittest.main()
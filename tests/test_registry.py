@@ -0,0 +1,122 @@
+import importlib.util
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+HAS_TORCH = all(importlib.util.find_spec(m) for m in ('torch', 'torchvision'))
+
+
+@unittest.skipUnless(HAS_TORCH, "torch and torchvision are not installed")
+class ModelRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def registry(self, budget_bytes=1 << 40):
+        from registry import ModelRegistry
+        return ModelRegistry(self.tmp_dir.name, budget_bytes)
+
+    def trained(self, labels=('cats', 'dogs')):
+        from model_wrapper import ModelWrapper
+        model_wrapper = ModelWrapper('resnet18', 'cpu')
+        model_wrapper.init_model(list(labels), freeze_backbone=True)
+        model_wrapper.trained = True
+        return model_wrapper
+
+    def test_eviction_keeps_models_loadable(self):
+        from model_wrapper import ModelWrapper
+        registry = self.registry(budget_bytes=1)
+        registry.save('first', ModelWrapper('resnet18', 'cpu'))
+        registry.save('second', ModelWrapper('resnet18', 'cpu'))
+        # the most recently used model always stays, however small the budget
+        self.assertEqual(list(registry.resident), ['second'])
+        self.assertFalse(registry.get_info('first')["resident"])
+        self.assertFalse(registry['first'].trained)
+        self.assertEqual(list(registry.resident), ['first'])
+        self.assertEqual(sorted(registry.keys()), ['first', 'second'])
+
+    def test_concurrent_requests_share_one_load(self):
+        import threading
+        import time
+        from unittest import mock
+        from model_wrapper import ModelWrapper
+        self.registry().save('my_model', ModelWrapper('resnet18', 'cpu'))
+        registry = self.registry()
+        load, release = ModelWrapper.load, threading.Event()
+
+        def slow_load(path):
+            release.wait(10)
+            return load(path)
+
+        results = []
+        with mock.patch.object(ModelWrapper, 'load', side_effect=slow_load) as mocked:
+            threads = [threading.Thread(target=lambda: results.append(registry['my_model'])) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            while mocked.call_count == 0:
+                time.sleep(0.01)
+            # the registry is not locked while the model loads
+            with registry.lock:
+                self.assertEqual(list(registry.loading), ['my_model'])
+            release.set()
+            for thread in threads:
+                thread.join(10)
+        self.assertEqual(mocked.call_count, 1)
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(registry.loading, {})
+
+    def test_index_survives_a_restart(self):
+        from model_wrapper import ModelWrapper
+        self.registry().save('my_model', ModelWrapper('resnet18', 'cpu'))
+        registry = self.registry()
+        self.assertIn('my_model', registry)
+        self.assertEqual(registry.resident, {})
+        self.assertEqual(registry['my_model'].backbone_name, 'resnet18')
+
+    def test_publish_and_rollback(self):
+        import torch
+        from model_wrapper import ModelWrapper
+        registry = self.registry()
+        registry.save('my_model', ModelWrapper('resnet18', 'cpu'))
+
+        first = self.trained()
+        self.assertEqual(registry.publish('my_model', first), 1)
+        second = self.trained(('cats', 'dogs', 'birds'))
+        self.assertEqual(registry.publish('my_model', second), 2)
+        self.assertIs(registry['my_model'], second)
+        self.assertEqual([v["version"] for v in registry.versions('my_model')], [1, 2])
+
+        model_wrapper = registry.rollback('my_model', 1)
+        self.assertIs(registry['my_model'], model_wrapper)
+        self.assertEqual(model_wrapper.version, 1)
+        self.assertEqual(list(model_wrapper.id2label), ['cats', 'dogs'])
+        self.assertTrue(torch.equal(model_wrapper.model.fc.weight, first.model.fc.weight))
+        # the current checkpoint follows the rollback after a restart
+        self.assertEqual(self.registry()['my_model'].version, 1)
+        with self.assertRaises(KeyError):
+            registry.rollback('my_model', 3)
+
+    def test_pop_removes_versions(self):
+        from model_wrapper import ModelWrapper
+        registry = self.registry()
+        registry.save('my_model', ModelWrapper('resnet18', 'cpu'))
+        registry.publish('my_model', self.trained())
+        registry.pop('my_model')
+        self.assertNotIn('my_model', registry)
+        self.assertEqual(registry.versions('my_model'), [])
+
+    def test_invalid_names_are_rejected(self):
+        from model_wrapper import ModelWrapper
+        for name in ('', '../escape', 'nested/name'):
+            with self.assertRaises(ValueError):
+                self.registry().save(name, ModelWrapper('resnet18', 'cpu', build_model=False))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,26 @@
+import importlib.util
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from benchmarks.startup import measure_startup
+
+
+@unittest.skipUnless(all(importlib.util.find_spec(m) for m in ('flask', 'flask_restx', 'torch')),
+                     "the app dependencies are not installed")
+class StartupTest(unittest.TestCase):
+    def test_heavy_modules_are_imported_lazily(self):
+        self.assertEqual(measure_startup(runs=1)["eagerly_loaded"], [])
+
+    # wall-clock time depends on the machine, so the budget is only checked on request
+    @unittest.skipUnless(os.environ.get('CHECK_STARTUP_TIME'), "set CHECK_STARTUP_TIME=1 to check the time budget")
+    def test_import_within_budget(self):
+        result = measure_startup(runs=3)
+        self.assertLessEqual(result["median_seconds"], config.STARTUP_TIME_BUDGET_SECONDS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import telemetry
+from tracking import Tracker
+
+
+class TrackerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tracker = Tracker(os.path.join(self.tmp_dir.name, 'tracking.db'), flush_interval=0.01)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_runs_and_metrics_are_stored(self):
+        run = self.tracker.start_run('run', 'my_model', 'project', 'experiment', {'lr': 0.01})
+        run.log(0, {'loss_train': 1.})
+        run.log(1, {'loss_train': .5})
+        run.finish('completed', {'best_score': .9})
+        self.assertTrue(self.tracker.flush(10))
+
+        info = self.tracker.get_run('run')
+        self.assertEqual(info["status"], 'completed')
+        self.assertEqual(info["config"], {'lr': 0.01})
+        self.assertEqual([m["loss_train"] for m in info["metrics"]], [1., .5])
+        self.assertEqual([r["run_id"] for r in self.tracker.list_runs('my_model')], ['run'])
+        self.assertIsNone(self.tracker.get_run('unknown'))
+
+    def test_failed_batch_is_counted_and_releases_flush(self):
+        before = sum(telemetry.TRACKING_DROPPED_EVENTS.values.values())
+        with self.assertLogs('tracking', 'ERROR'):
+            # a malformed event makes the whole batch fail
+            self.tracker._put(('log', 'run', 0))
+            self.assertTrue(self.tracker.flush(10))
+        self.assertEqual(self.tracker.get_stats()["events_dropped"], 1)
+        self.assertEqual(sum(telemetry.TRACKING_DROPPED_EVENTS.values.values()) - before, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import importlib.util
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+HAS_APP = all(importlib.util.find_spec(m) for m in ('torch', 'torchvision', 'PIL', 'flask', 'flask_restx'))
+
+
+@unittest.skipUnless(HAS_APP, "torch, torchvision, Pillow and flask_restx are not installed")
+class RunTrainingTest(unittest.TestCase):
+    def setUp(self):
+        from PIL import Image
+
+        import app
+        import config
+        from registry import ModelRegistry
+        from tracking import Tracker
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        root = self.tmp_dir.name
+        self.dataset_path = os.path.join(root, 'dataset')
+        for label, color in (('cats', (255, 0, 0)), ('dogs', (0, 0, 255))):
+            os.makedirs(os.path.join(self.dataset_path, label))
+            for i in range(3):
+                Image.new('RGB', (8, 8), color).save(os.path.join(self.dataset_path, label, f'{i}.png'))
+
+        self.patches = [mock.patch.object(app, 'MODELS_DICT', ModelRegistry(os.path.join(root, 'models'), 1 << 40)),
+                        mock.patch.object(app, 'TRACKER', Tracker(os.path.join(root, 'tracking.db'))),
+                        mock.patch.object(config, 'MANIFEST_DIR', os.path.join(root, 'manifests')),
+                        mock.patch.object(config, 'EMBEDDING_CACHE_DIR', os.path.join(root, 'embeddings')),
+                        mock.patch.object(config, 'COMPILE_AFTER_TRAIN', False)]
+        for patch in self.patches:
+            patch.start()
+        self.app = app
+
+    def tearDown(self):
+        for patch in reversed(self.patches):
+            patch.stop()
+        self.tmp_dir.cleanup()
+
+    def run_training(self, **params):
+        from api_parsers import parserTrain
+        from jobs import Job
+        from model_wrapper import ModelWrapper
+
+        self.app.MODELS_DICT.save('my_model', ModelWrapper('resnet18', 'cpu'))
+        query = dict({'model_name': 'my_model', 'dataset_path': self.dataset_path, 'epochs_numb': 1,
+                      'batch_size': 2, 'valid_part': 0.34}, **params)
+        with self.app.app.test_request_context('/models/train', query_string=query):
+            args = parserTrain.parse_args()
+        return self.app.run_training(Job('my_model', args))
+
+    def test_run_training_publishes_a_new_version(self):
+        # the training config once shadowed the config module inside run_training and crashed every job
+        result = self.run_training()
+        self.assertEqual(result["version"], 1)
+        model_wrapper = self.app.MODELS_DICT['my_model']
+        self.assertTrue(model_wrapper.trained)
+        self.assertEqual(list(model_wrapper.id2label), ['cats', 'dogs'])
+
+    def test_frozen_backbone_on_precomputed_embeddings(self):
+        result = self.run_training(freeze_backbone='true', precompute_embeddings='true')
+        self.assertEqual(result["version"], 1)
+        self.assertTrue(os.listdir(os.path.join(self.tmp_dir.name, 'embeddings')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,250 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import telemetry
+
+logger = logging.getLogger(__name__)
+
+_FLUSH = 'flush'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    model_name TEXT,
+    project TEXT,
+    name TEXT,
+    config TEXT,
+    status TEXT,
+    summary TEXT,
+    started_at REAL,
+    finished_at REAL,
+    wandb_status TEXT,
+    wandb_url TEXT
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id TEXT,
+    step INTEGER,
+    data TEXT,
+    logged_at REAL
+);
+CREATE INDEX IF NOT EXISTS metrics_run ON metrics (run_id, step);
+"""
+
+
+class Run:
+    """Handle the training loop logs through; every call only enqueues."""
+
+    def __init__(self, tracker, run_id):
+        self.tracker = tracker
+        self.run_id = run_id
+
+    def log(self, step, metrics):
+        self.tracker.log(self.run_id, step, metrics)
+
+    def finish(self, status, summary=None):
+        self.tracker.finish_run(self.run_id, status, summary)
+
+
+class Tracker:
+    """Experiment tracking store in SQLite, written by a background thread.
+
+    Events are queued without blocking and written in batches, one transaction per flush. Runs started with
+    `sync_wandb=True` are uploaded to W&B by a separate thread once they are finished, so W&B is only a
+    later copy of the local store.
+    """
+
+    def __init__(self, db_path: str, flush_interval: float = 1., max_batch: int = 256):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.wandb_queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.writer = None
+        self.wandb_thread = None
+        self.num_written = 0
+        self.num_flushes = 0
+        self.num_dropped = 0
+
+    def _connect(self):
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(_SCHEMA)
+        return conn
+
+    def _put(self, event):
+        # threads are started on first use so that importing the module stays free of side effects
+        with self.lock:
+            if self.writer is None:
+                self.writer = threading.Thread(target=self._write_loop, daemon=True, name='tracking-writer')
+                self.writer.start()
+        self.queue.put_nowait(event)
+
+    def start_run(self, run_id, model_name, project, name, config, sync_wandb=False):
+        self._put(('start', run_id, model_name, project, name, json.dumps(config, default=str), time.time(),
+                   'pending' if sync_wandb else None))
+        return Run(self, run_id)
+
+    def log(self, run_id, step, metrics):
+        self._put(('log', run_id, step, json.dumps(metrics, default=float), time.time()))
+
+    def finish_run(self, run_id, status, summary=None):
+        self._put(('finish', run_id, status, json.dumps(summary or {}, default=str), time.time()))
+
+    def flush(self, timeout=None):
+        """Blocks until everything queued so far is written; not meant for the training loop."""
+        done = threading.Event()
+        self._put((_FLUSH, done))
+        return done.wait(timeout)
+
+    def _collect(self):
+        events = [self.queue.get()]
+        deadline = time.perf_counter() + self.flush_interval
+        while len(events) < self.max_batch and events[-1][0] != _FLUSH:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                events.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return events
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            events = self._collect()
+            # flush waiters are released even if the batch fails, so flush() never blocks forever
+            waiters = [event[1] for event in events if event[0] == _FLUSH]
+            finished = []
+            try:
+                with conn:
+                    for event in events:
+                        kind = event[0]
+                        if kind == 'start':
+                            conn.execute('INSERT OR REPLACE INTO runs (run_id, model_name, project, name, config, '
+                                         'status, started_at, wandb_status) VALUES (?, ?, ?, ?, ?, \'running\', ?, ?)',
+                                         event[1:])
+                        elif kind == 'log':
+                            conn.execute('INSERT INTO metrics (run_id, step, data, logged_at) VALUES (?, ?, ?, ?)',
+                                         event[1:])
+                        elif kind == 'finish':
+                            _, run_id, status, summary, finished_at = event
+                            conn.execute('UPDATE runs SET status = ?, summary = ?, finished_at = ? WHERE run_id = ?',
+                                         (status, summary, finished_at, run_id))
+                            finished.append(run_id)
+                self.num_written += len(events) - len(waiters)
+                self.num_flushes += 1
+            except sqlite3.Error:
+                dropped = len(events) - len(waiters)
+                self.num_dropped += dropped
+                telemetry.TRACKING_DROPPED_EVENTS.inc(dropped)
+                logger.exception('Dropped %d tracking events', dropped)
+            for done in waiters:
+                done.set()
+            for run_id in finished:
+                row = conn.execute('SELECT wandb_status FROM runs WHERE run_id = ?', (run_id,)).fetchone()
+                if row is not None and row[0] == 'pending':
+                    self._schedule_wandb(run_id)
+
+    def _schedule_wandb(self, run_id):
+        with self.lock:
+            if self.wandb_thread is None:
+                self.wandb_thread = threading.Thread(target=self._wandb_loop, daemon=True, name='tracking-wandb')
+                self.wandb_thread.start()
+        self.wandb_queue.put(run_id)
+
+    def sync_pending(self):
+        """Uploads finished runs that are still waiting for W&B, e.g. from before a restart."""
+        conn = self._connect()
+        try:
+            run_ids = [row[0] for row in conn.execute(
+                "SELECT run_id FROM runs WHERE wandb_status = 'pending' AND finished_at IS NOT NULL")]
+        finally:
+            conn.close()
+        for run_id in run_ids:
+            self._schedule_wandb(run_id)
+        return len(run_ids)
+
+    def _wandb_loop(self):
+        conn = self._connect()
+        while True:
+            run_id = self.wandb_queue.get()
+            try:
+                url = self._sync_wandb(conn, run_id)
+                status = 'synced'
+            except Exception as e:
+                url, status = None, f'failed: {e!r}'
+            with conn:
+                conn.execute('UPDATE runs SET wandb_status = ?, wandb_url = ? WHERE run_id = ?',
+                             (status, url, run_id))
+
+    def _sync_wandb(self, conn, run_id):
+        import wandb  # only imported once a run is actually synced
+
+        project, name, config, summary = conn.execute(
+            'SELECT project, name, config, summary FROM runs WHERE run_id = ?', (run_id,)).fetchone()
+        run = wandb.init(project=project, name=name, config=json.loads(config), reinit=True)
+        try:
+            for step, data in conn.execute('SELECT step, data FROM metrics WHERE run_id = ? ORDER BY step, rowid',
+                                           (run_id,)):
+                run.log(json.loads(data), step=step)
+            run.summary.update(json.loads(summary or '{}'))
+            return run.get_url()
+        finally:
+            run.finish()
+
+    def _run_info(self, row):
+        run_id, model_name, project, name, config, status, summary, started_at, finished_at, \
+            wandb_status, wandb_url = row
+        return {"run_id": run_id,
+                "model_name": model_name,
+                "project": project,
+                "name": name,
+                "config": json.loads(config) if config else None,
+                "status": status,
+                "summary": json.loads(summary) if summary else None,
+                "started_at": started_at,
+                "finished_at": finished_at,
+                "wandb": {"status": wandb_status, "url": wandb_url}}
+
+    def list_runs(self, model_name=None, limit=100):
+        conn = self._connect()
+        try:
+            query = 'SELECT * FROM runs'
+            params = ()
+            if model_name is not None:
+                query += ' WHERE model_name = ?'
+                params = (model_name,)
+            query += ' ORDER BY started_at DESC LIMIT ?'
+            return [self._run_info(row) for row in conn.execute(query, params + (limit,))]
+        finally:
+            conn.close()
+
+    def get_run(self, run_id):
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT * FROM runs WHERE run_id = ?', (run_id,)).fetchone()
+            if row is None:
+                return None
+            info = self._run_info(row)
+            info["metrics"] = [dict(json.loads(data), step=step) for step, data in conn.execute(
+                'SELECT step, data FROM metrics WHERE run_id = ? ORDER BY step, rowid', (run_id,))]
+            return info
+        finally:
+            conn.close()
+
+    def get_stats(self):
+        return {"queue_depth": self.queue.qsize(),
+                "events_written": self.num_written,
+                "flushes": self.num_flushes,
+                "events_dropped": self.num_dropped,
+                "wandb_queue_depth": self.wandb_queue.qsize()}
@@ -1,13 +1,48 @@
-import copy
+import hashlib
+import os
+import threading
+import time
 from typing import List
 
-import wandb
 import torch
+from torch import distributed as dist
 from torch import nn
 from torch import optim
-from torch.utils.data import DataLoader
+from torch.utils.data import DataLoader, Subset, TensorDataset
 
+import profiling
+import telemetry
+from evaluation import evaluate
 from model_wrapper import ModelWrapper
+from tensor_cache import dataset_fingerprint
+from tracking import Run
+
+
+class TrainingCancelled(Exception):
+    pass
+
+
+class BestCheckpoint:
+    """Keeps CPU copies of the tensors that training can change: learnable parameters and buffers."""
+
+    def __init__(self, model: nn.Module):
+        self.tensors = {name: param for name, param in model.named_parameters() if param.requires_grad}
+        self.tensors.update(dict(model.named_buffers()))
+        self.buffers = {name: torch.empty(t.shape, dtype=t.dtype, device='cpu') for name, t in self.tensors.items()}
+        self.saved = False
+
+    @torch.no_grad()
+    def snapshot(self):
+        for name, t in self.tensors.items():
+            self.buffers[name].copy_(t.detach())
+        self.saved = True
+
+    @torch.no_grad()
+    def restore(self):
+        if not self.saved:
+            return
+        for name, t in self.tensors.items():
+            t.copy_(self.buffers[name])
 
 
 class Trainer:
@@ -17,73 +52,215 @@ class Trainer:
             model_wrapper: ModelWrapper,
             dataloaders: List[DataLoader],
             id2label: List[str],
-            wandb_enable: bool = False):
+            run: Run = None,
+            stop_event=None):
         self.config = config
         self.model_wrapper = model_wrapper
         self.dataloaders = dataloaders
 
-        self.metrics = {phase: {'accuracy': [], 'loss': []} for phase in self.dataloaders.keys()}
-        self.model_wrapper.init_model(id2label, config['freeze_backbone'])
+        self.metrics = {phase: {'accuracy': [], 'loss': [], 'images_per_sec': []} for phase in self.dataloaders.keys()}
+        self.model_wrapper.init_model(id2label, config['freeze_backbone'], config.get('share_backbone', False))
         self.optimizer = getattr(optim, config['optimizer_name'])(params=self.model_wrapper.learnable_parameters, lr=config['lr'])
-        self.scheduler = optim.lr_scheduler.CosineAnnealingLR(self.optimizer, T_max=2)
+        self.scheduler = None
         self.criterion = nn.CrossEntropyLoss()
 
         self.last_record = 0.
-        self.best_model = None
-        self.wandb_enable = wandb_enable
+        self.best_epoch = None
+        self.stopped_epoch = None
+        # a shared backbone is frozen and in eval mode, only the head can change
+        self.checkpoint = BestCheckpoint(self.model_wrapper.model.fc if self.model_wrapper.shared_backbone
+                                         else self.model_wrapper.model)
+        self.patience = config.get('patience')
+        self.min_delta = config.get('min_delta', 0.)
+        self.restore_best = config.get('restore_best', True)
+        self.precision = config.get('precision', 'fp32')
+        self.channels_last = config.get('channels_last', False)
+        self.run = run
+        self.stop_event = stop_event
+        self.use_embeddings = config.get('precompute_embeddings', False) and config['freeze_backbone']
+        self.ddp_model = None
+        self.model_name = config.get('model_name', 'unknown')
+        self.profile_session = None
+        self.stage_seconds = {phase: dict.fromkeys(('data_wait', 'forward', 'backward', 'optimizer'), 0.)
+                              for phase in self.dataloaders.keys()}
+        self.epoch_callback = None
+        self.embedding_dataloaders = None
+
+    def _dataset_samples(self, dataset):
+        if isinstance(dataset, Subset):
+            samples = self._dataset_samples(dataset.dataset)
+            return None if samples is None else [samples[i] for i in dataset.indices]
+        return getattr(dataset, 'samples', None)
+
+    def _embedding_cache_path(self):
+        cache_dir = self.config.get('embedding_cache_dir')
+        if cache_dir is None:
+            return None
+        h = hashlib.sha1(self.model_wrapper.backbone_fingerprint().encode())
+        for phase in sorted(self.dataloaders.keys()):
+            samples = self._dataset_samples(self.dataloaders[phase].dataset)
+            if samples is None:
+                return None
+            h.update(dataset_fingerprint(self.config.get('dataset_path', ''), samples, phase).encode())
+        return os.path.join(cache_dir, h.hexdigest() + '.pt')
+
+    def compute_embeddings(self):
+        cache_path = self._embedding_cache_path()
+        if cache_path is not None and os.path.isfile(cache_path):
+            embeddings = torch.load(cache_path)
+        else:
+            self.model_wrapper.eval()
+            embeddings = {}
+            with torch.inference_mode():
+                for phase, dataloader in self.dataloaders.items():
+                    features, targets = [], []
+                    for inputs, labels in dataloader:
+                        if self.stop_event is not None and self.stop_event.is_set():
+                            raise TrainingCancelled()
+                        features.append(self.model_wrapper.get_features(inputs.to(self.model_wrapper.device)).cpu())
+                        targets.append(labels)
+                    embeddings[phase] = (torch.cat(features), torch.cat(targets))
+            if cache_path is not None:
+                os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+                # concurrent jobs with the same key must never read a partially written file
+                tmp_path = f'{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+                torch.save(embeddings, tmp_path)
+                os.replace(tmp_path, cache_path)
+
+        return {phase: DataLoader(TensorDataset(*embeddings[phase]), batch_size=self.dataloaders[phase].batch_size,
+                                  shuffle=phase == 'train')
+                for phase in embeddings}
 
     def train(self, num_epochs=100):
+        try:
+            self._train(num_epochs)
+        finally:
+            if self.profile_session is not None:
+                self.profile_session.stop()
+                self.profile_session = None
+
+    def _train(self, num_epochs):
+        dataloaders = self.dataloaders
+        forward = self.model_wrapper.get_logits if self.ddp_model is None else self.ddp_model
+        if self.use_embeddings:
+            # only the linear head is trainable, so the backbone runs once and epochs train on cached features
+            if self.embedding_dataloaders is None:
+                self.embedding_dataloaders = self.compute_embeddings()
+            dataloaders = self.embedding_dataloaders
+            forward = self.model_wrapper.get_head_logits
+
+        # the cosine schedule spans the whole run since the scheduler steps once per batch
+        self.scheduler = optim.lr_scheduler.CosineAnnealingLR(
+            self.optimizer, T_max=max(1, num_epochs * len(dataloaders['train'])))
+
+        device = torch.device(self.model_wrapper.device)
+        memory_format = torch.channels_last if self.channels_last and not self.use_embeddings \
+            else torch.preserve_format
+        # a shared backbone is used by other models as well and keeps its layout
+        if memory_format == torch.channels_last and not self.model_wrapper.shared_backbone:
+            self.model_wrapper.model.to(memory_format=memory_format)
+
         for epoch in range(num_epochs):
             for phase in ['train', 'valid']:
                 if phase == 'train':
+                    # a DistributedSampler reshuffles its shard only when told the epoch
+                    sampler = getattr(dataloaders[phase], 'sampler', None)
+                    if hasattr(sampler, 'set_epoch'):
+                        sampler.set_epoch(epoch)
                     self.model_wrapper.train()
+                    if self.profile_session is None and profiling.PROFILER.pending:
+                        self.profile_session = profiling.PROFILER.take(self.model_name, 'train')
                 else:
                     self.model_wrapper.eval()
-                running_loss = 0.0
-                running_corrects = 0
+                # accumulated on the device and synchronized once per epoch
+                running_loss = torch.zeros((), device=device)
+                running_corrects = torch.zeros((), dtype=torch.long, device=device)
+                seen = 0
+                start_time = time.perf_counter()
 
-                for inputs, labels in self.dataloaders[phase]:
-                    inputs = inputs.to(self.model_wrapper.device)
-                    labels = labels.to(self.model_wrapper.device)
-                    self.optimizer.zero_grad()
-                    with torch.set_grad_enabled(phase == 'train'):
+                # wall-clock time per stage; on accelerators forward/backward only cover kernel launches
+                # because synchronizing here would stall the pipeline
+                stage_seconds = dict.fromkeys(('data_wait', 'forward', 'backward', 'optimizer'), 0.)
+                step_end = time.perf_counter()
+                for inputs, labels in dataloaders[phase]:
+                    if self.stop_event is not None and self.stop_event.is_set():
+                        raise TrainingCancelled()
+                    inputs = inputs.to(device, memory_format=memory_format, non_blocking=True)
+                    labels = labels.to(device, non_blocking=True)
+                    forward_start = time.perf_counter()
+                    stage_seconds['data_wait'] += forward_start - step_end
+                    self.optimizer.zero_grad(set_to_none=True)
+                    with torch.set_grad_enabled(phase == 'train'), \
+                            torch.autocast(device.type, dtype=torch.bfloat16, enabled=self.precision == 'bf16'):
 
-                        outputs = self.model_wrapper.get_logits(inputs)
+                        outputs = forward(inputs)
                         loss = self.criterion(outputs, labels)
-                        _, preds = torch.max(outputs, 1)
+                        preds = outputs.argmax(1)
+                    forward_end = time.perf_counter()
+                    stage_seconds['forward'] += forward_end - forward_start
 
-                        if phase == 'train':
-                            loss.backward()
-                            self.optimizer.step()
-                            self.scheduler.step()
+                    if phase == 'train':
+                        loss.backward()
+                        backward_end = time.perf_counter()
+                        stage_seconds['backward'] += backward_end - forward_end
+                        self.optimizer.step()
+                        self.scheduler.step()
+                        stage_seconds['optimizer'] += time.perf_counter() - backward_end
+                        if self.profile_session is not None and self.profile_session.step():
+                            self.profile_session = None
 
-                    running_loss += loss.item() * inputs.size(0)
-                    running_corrects += torch.sum(preds == labels.data)
+                    running_loss += loss.detach().float() * inputs.size(0)
+                    running_corrects += (preds == labels).sum()
+                    seen += inputs.size(0)
+                    step_end = time.perf_counter()
 
-                self.metrics[phase]['loss'].append(running_loss / len(self.dataloaders[phase].dataset))
-                self.metrics[phase]['accuracy'].append(running_corrects / len(self.dataloaders[phase].dataset))
+                # the samples actually seen: a DistributedSampler pads the shards to equal length
+                totals = torch.stack([running_loss, running_corrects.float(),
+                                      torch.tensor(float(seen), device=device)])
+                if dist.is_available() and dist.is_initialized():
+                    dist.all_reduce(totals)
+                epoch_loss, epoch_corrects, n = totals.tolist()
+                n = max(1, int(n))
+                elapsed = time.perf_counter() - start_time
+                self.metrics[phase]['loss'].append(epoch_loss / n)
+                self.metrics[phase]['accuracy'].append(epoch_corrects / n)
+                self.metrics[phase]['images_per_sec'].append(n / elapsed if elapsed > 0 else 0.)
+                for stage, seconds in stage_seconds.items():
+                    self.stage_seconds[phase][stage] += seconds
+                    telemetry.TRAIN_STAGE_SECONDS.inc(seconds, model=self.model_name, stage=stage)
+                telemetry.TRAIN_IMAGES.inc(seen, model=self.model_name, phase=phase)
+                telemetry.TRAIN_IMAGES_PER_SECOND.set(self.metrics[phase]['images_per_sec'][-1],
+                                                      model=self.model_name, phase=phase)
 
-                print('{:>12} {:>12} {:>12.3f} {:>12.3f}'.format(epoch, phase, self.metrics[phase]['loss'][-1],
-                                                                 self.metrics[phase]['accuracy'][-1]))
+                print('{:>12} {:>12} {:>12.3f} {:>12.3f} {:>12.1f} img/s'.format(
+                    epoch, phase, self.metrics[phase]['loss'][-1], self.metrics[phase]['accuracy'][-1],
+                    self.metrics[phase]['images_per_sec'][-1]))
 
                 if phase == 'valid':
-                    if self.metrics[phase]['accuracy'][-1] > self.last_record:
+                    if self.metrics[phase]['accuracy'][-1] > self.last_record + self.min_delta:
                         self.last_record = self.metrics[phase]['accuracy'][-1]
-                        self.best_model = copy.deepcopy(self.model_wrapper.model)
+                        self.best_epoch = epoch
+                        self.checkpoint.snapshot()
                         print('new best model achieved with test accuracy {:.3f}'.format(self.last_record))
 
-                if self.wandb_enable:
-                    wandb.log({f"accuracy_{phase}": self.metrics[phase]['accuracy'][-1],
-                               f"loss_{phase}": self.metrics[phase]['loss'][-1],
-                               f"learning rate": self.scheduler._last_lr[0]})
-
-    def eval(self, dataloader, metric_func=None):
-        total_metrics = 0
-        for inputs, labels in self.dataloaders:
-            inputs = inputs.to(self.model_wrapper.device)
-            labels = labels.to(self.model_wrapper.device)
-
-            outputs = self.modelWrapper.get_logits(inputs)
-            _, preds = torch.max(outputs, 1)
-            total_metrics += metric_func(labels.data, preds.data)
-        return total_metrics/len(dataloader)
+                if self.run is not None:
+                    # only enqueued; the tracking store is written by a background thread
+                    self.run.log(epoch, {f"accuracy_{phase}": self.metrics[phase]['accuracy'][-1],
+                                         f"loss_{phase}": self.metrics[phase]['loss'][-1],
+                                         f"images_per_sec_{phase}": self.metrics[phase]['images_per_sec'][-1],
+                                         f"learning rate": self.scheduler.get_last_lr()[0]})
+
+            if self.epoch_callback is not None:
+                self.epoch_callback(epoch, self.metrics)
+
+            last_improvement = self.best_epoch if self.best_epoch is not None else -1
+            if self.patience is not None and epoch - last_improvement >= self.patience:
+                self.stopped_epoch = epoch
+                print('early stopping: no improvement for {} epochs'.format(self.patience))
+                break
+
+        if self.restore_best:
+            self.checkpoint.restore()
+
+    def eval(self, dataloader, top_k=(1, 5)):
+        return evaluate(self.model_wrapper, dataloader, top_k=top_k)